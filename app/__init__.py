@@ -1,3 +1,5 @@
+import logging
+
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
@@ -8,6 +10,8 @@ from config import Config
 
 app = Flask(__name__)
 app.config.from_object(Config)
+logging.basicConfig(level=app.config["LOG_LEVEL"],
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s")
 db = SQLAlchemy(app)
 migrate = Migrate(app, db)
 
@@ -0,0 +1,94 @@
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from app.main.excel import StreamWriter
+from app.main.jobs import run_compliance
+
+def workbooks(folder):
+    """ Workbooks of a folder by period, the file name without its
+    extensions, eg: "2022-10.xlsx" -> "2022-10"."""
+
+    res = {}
+    for entry in os.scandir(folder):
+        if entry.is_file() and not entry.name.startswith((".", "~$")):
+            res[entry.name.split(".", 1)[0]] = entry.path
+    return res
+
+def find_periods(op_folder, non_op_folder, tickets_folder):
+    """ Return the periods with an operative, a non operative and a
+    tickets workbook, as {period: (op, non_op, tickets)}, and the periods
+    missing some of them."""
+
+    folders = [
+            workbooks(folder)
+            for folder in [op_folder, non_op_folder, tickets_folder]]
+    found = set.union(*(set(folder) for folder in folders))
+    periods = {
+            period: tuple(folder[period] for folder in folders)
+            for period in sorted(found)
+            if all(period in folder for folder in folders)}
+    return periods, sorted(found - set(periods))
+
+def run_period(period, paths, remove_ids, types, report_folder):
+    """ Compliance report of one period. Return the period, the report
+    path and the seconds it took."""
+
+    start = time.perf_counter()
+    path = run_compliance(
+            *paths, remove_ids=remove_ids, types=types,
+            report_folder=report_folder,
+            progress=lambda stage, **info: None)
+    return period, path, time.perf_counter() - start
+
+def run_batch(periods, remove_ids, types, report_folder, output_folder,
+        max_workers, done=None):
+    """ Write the compliance report of every period to "output_folder" in
+    a process pool, plus the payment summary of all of them. "done" is
+    called with the period, the report path and the seconds it took as
+    reports finish. Return the path of the summary."""
+
+    if done is None:
+        done = lambda period, path, seconds: None
+    os.makedirs(output_folder, exist_ok=True)
+
+    reports = {}
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+                executor.submit(
+                        run_period, period, paths, remove_ids, types,
+                        report_folder)
+                for period, paths in periods.items()]
+        for future in as_completed(futures):
+            period, path, seconds = future.result()
+
+            # Reports are kept in the report cache, the output gets a
+            # copy named after the period.
+            reports[period] = os.path.join(
+                    output_folder, "Compliance_{}.xlsx".format(period))
+            shutil.copyfile(path, reports[period])
+            done(period, reports[period], seconds)
+
+    summary = payment_summary(
+            {period: reports[period] for period in sorted(reports)})
+    path = os.path.join(output_folder, "Payment_Summary.xlsx")
+    with StreamWriter(path) as writer:
+        writer.write_frame(summary, "Payment Summary")
+    return path
+
+def payment_summary(reports):
+    """ Payment summaries of the reports of several periods, one after
+    the other, with the period they belong to."""
+
+    summaries = []
+    for period, path in reports.items():
+        summary = pd.read_excel(
+                path, sheet_name="Payment Summary", index_col=0)
+        summary.insert(0, "period", period)
+        summaries.append(summary)
+    if not summaries:
+        return pd.DataFrame()
+    return pd.concat(summaries, ignore_index=True)
@@ -0,0 +1,177 @@
+import threading
+from collections import OrderedDict
+
+from app.main.reporter import Reporter, memory_breakdown
+from app.main.store import load_rollup, dataset_version
+from app.main.shared import shared_datasets
+from app.main.locations import locations
+from app.main.filtering import normalize_filters, RANGE_KEYS
+from app.main.timing import stage
+from config import Config
+
+class ReporterCache:
+    """ LRU cache of evaluated reporters, bounded by the memory their
+    frames use."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.locations_version = None
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key][0]
+
+    def put(self, key, reporter):
+        nbytes = reporter_nbytes(reporter)
+        with self.lock:
+            if key in self.entries:
+                self.size -= self.entries.pop(key)[1]
+            if nbytes > self.max_bytes:
+                return
+            self.entries[key] = (reporter, nbytes)
+            self.size += nbytes
+
+            # Evict least recently used reporters until under budget.
+            while self.size > self.max_bytes:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.size -= evicted
+
+    def invalidate(self, dataset_id=None):
+        """ Drop the reporters built from "dataset_id", or all of them."""
+
+        with self.lock:
+            for key in list(self.entries):
+                if dataset_id is None or key[0] == dataset_id:
+                    self.size -= self.entries.pop(key)[1]
+
+    def memory(self):
+        """ Memory breakdown of the frames of every cached reporter."""
+
+        with self.lock:
+            entries = list(self.entries.items())
+        return [
+                {
+                        "dataset": key[0],
+                        "filters": dict(key[3]),
+                        "frames": reporter_memory(reporter)}
+                for key, (reporter, _) in entries]
+
+    def rows(self):
+        """ Rows of the frames of every cached reporter."""
+
+        with self.lock:
+            entries = list(self.entries.items())
+        return [
+                {
+                        "dataset": key[0],
+                        "filters": dict(key[3]),
+                        "rows": {
+                                name: len(frame) for name, frame in
+                                reporter_frames(reporter).items()}}
+                for key, (reporter, _) in entries]
+
+    def stats(self):
+        with self.lock:
+            return {
+                    "entries": len(self.entries),
+                    "bytes": self.size,
+                    "max_bytes": self.max_bytes,
+                    "hits": self.hits,
+                    "misses": self.misses}
+
+reporter_cache = ReporterCache(Config.REPORTER_CACHE_BYTES)
+
+def reporter_nbytes(reporter):
+    """ Memory held by the frames of an evaluated reporter."""
+
+    return int(sum(
+            frame.memory_usage(index=True, deep=True).sum()
+            for frame in reporter_frames(reporter).values()))
+
+def reporter_frames(reporter):
+    """ Frames held by an evaluated reporter, by name."""
+
+    frames = {"filtered": reporter.filtered, "evaluated": reporter.evaluated}
+    if reporter.rollup is not None:
+        frames["rollup"] = reporter.rollup
+    return frames
+
+def reporter_memory(reporter):
+    """ Memory breakdown of each frame of an evaluated reporter."""
+
+    return {
+            name: memory_breakdown(frame)
+            for name, frame in reporter_frames(reporter).items()}
+
+def cache_key(dataset_id, version, filters):
+    frozen = tuple(sorted(
+            (key, tuple(value) if isinstance(value, list) else value)
+            for key, value in filters.items()))
+    return (dataset_id, dataset_version(dataset_id), version, frozen)
+
+def get_reporter(data_path, filters=None):
+    """ Return the evaluated and filtered reporter of a dataset, building
+    it only if it is not cached yet. The result is shared, callers must
+    not modify it."""
+
+    filters = normalize_filters(filters)
+
+    # A new locations file makes every cached reporter stale.
+    with stage("locations"):
+        ids, version = locations.get()
+    if version != reporter_cache.locations_version:
+        reporter_cache.invalidate()
+        reporter_cache.locations_version = version
+
+    with stage("cache"):
+        key = cache_key(data_path, version, filters)
+        reporter = reporter_cache.get(key)
+    if reporter is not None:
+        return reporter
+
+    # A date range is sliced out of the unfiltered reporter through its
+    # time indexes when that one is cached, instead of loading again.
+    if "start" in filters or "end" in filters:
+        base = reporter_cache.get(cache_key(data_path, version, {}))
+        if base is not None:
+            with stage("select_dates"):
+                reporter = base.select_dates(
+                        filters.get("start"), filters.get("end"))
+            columns = {
+                    key: value for key, value in filters.items()
+                    if key not in RANGE_KEYS}
+            if columns:
+                with stage("apply_filters"):
+                    reporter.apply_filters(columns)
+            reporter_cache.put(key, reporter)
+            return reporter
+
+    # Every worker maps the same published copy of the dataset. Filters
+    # are applied in memory, after evaluation.
+    with stage("attach"):
+        test_data = shared_datasets.get(data_path)
+    with stage("rollup"):
+        reporter = Reporter(test_data, load_rollup(data_path))
+    with stage("filter_sites"):
+        reporter.filter_sites(ids)
+    with stage("eval"):
+        reporter.eval_tests()
+    if filters:
+        with stage("apply_filters"):
+            reporter.apply_filters(filters)
+
+    # Raw tests are not needed once filtered.
+    reporter.test_data = None
+
+    reporter_cache.put(key, reporter)
+    return reporter
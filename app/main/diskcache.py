@@ -0,0 +1,43 @@
+import os
+import shutil
+
+def remove(path):
+    """ Remove a file or a folder, if it still exists."""
+
+    try:
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def entry_size(entry):
+    """ Bytes of a file, or of the files of a folder."""
+
+    if entry.is_dir():
+        return sum(item.stat().st_size for item in os.scandir(entry.path))
+    return entry.stat().st_size
+
+def evict_lru(folder, max_bytes, select, keep=None):
+    """ Remove the least recently used entries of "folder", the files or
+    folders "select" accepts, but "keep", until they fit in "max_bytes".
+    Their modification time tells which were used last."""
+
+    entries = []
+    for entry in os.scandir(folder):
+        if select(entry):
+            try:
+                entries.append(
+                        (entry.stat().st_mtime, entry_size(entry),
+                                entry.path))
+            except FileNotFoundError:
+                # Removed in the meantime.
+                pass
+    size = sum(item[1] for item in entries)
+    for _, item_size, path in sorted(entries):
+        if size <= max_bytes:
+            break
+        if path != keep:
+            remove(path)
+            size -= item_size
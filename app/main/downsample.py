@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+
+# Largest number of horizontal buckets a client can ask for.
+MAX_WIDTH = 10000
+
+def minmax_downsample(x, y, passed, buckets):
+    """ Split the x range in "buckets" equal parts and keep, for every
+    part and pass/fail class, only the points with the lowest and the
+    highest y. Return the positions of the kept points sorted by x."""
+
+    if len(x) == 0:
+        return np.empty(0, dtype=np.intp)
+
+    span = max(x.max() - x.min(), 1)
+    bucket = ((x - x.min()) * buckets // (span + 1)).astype(np.int64)
+    group = bucket*2 + passed.astype(np.int64)
+
+    y = pd.Series(y)
+    keep = np.union1d(
+            y.groupby(group).idxmin().dropna().to_numpy(np.intp),
+            y.groupby(group).idxmax().dropna().to_numpy(np.intp))
+    return keep[np.argsort(x[keep], kind="stable")]
+
+def throughput_series(data, direction, start=None, end=None, width=1000):
+    """ Throughput of evaluated tests in one direction as JSON-ready
+    lists. "start" and "end" bound the viewport in epoch milliseconds.
+    Windows with more points than two per bucket and class are
+    downsampled, smaller windows are returned at full resolution."""
+
+    width = min(max(width, 1), MAX_WIDTH)
+
+    x = data["timestamp"].to_numpy().astype("datetime64[ms]").astype(
+            np.int64)
+    y = data[direction + "_br"].to_numpy(dtype=float)
+    passed = data[direction + "_pass"].to_numpy(dtype=bool)
+
+    window = np.ones(len(x), dtype=bool)
+    if start is not None:
+        window &= x >= start
+    if end is not None:
+        window &= x <= end
+    x, y, passed = x[window], y[window], passed[window]
+    total = len(x)
+
+    downsampled = total > 4*width
+    if downsampled:
+        keep = minmax_downsample(x, y, passed, width)
+    else:
+        keep = np.argsort(x, kind="stable")
+    x, y, passed = x[keep], y[keep], passed[keep]
+
+    return {
+            "direction": direction,
+            "total": total,
+            "returned": len(x),
+            "downsampled": bool(downsampled),
+            "x": x.tolist(),
+            "y": [None if np.isnan(value) else value for value in y],
+            "pass": passed.tolist()}
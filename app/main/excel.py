@@ -0,0 +1,74 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import xlsxwriter
+
+# Format of the header row and the index column, like pandas writes them.
+HEADER_FORMAT = {
+        "bold": True, "border": 1, "align": "center", "valign": "top"}
+
+DATETIME_FORMAT = "yyyy-mm-dd hh:mm:ss"
+
+def cells(values):
+    """ Python values of a column or an index, None for missing values.
+    Infinite numbers become "inf" and "-inf" as pandas writes them."""
+
+    values = pd.Series(values)
+    missing = values.isna().to_numpy()
+    res = values.astype(object).tolist()
+    if values.dtype.kind == "f":
+        res = [
+                value if np.isfinite(value)
+                else "inf" if value > 0 else "-inf"
+                for value in res]
+    return [None if miss else value for value, miss in zip(res, missing)]
+
+class StreamWriter:
+    """ Workbook written with xlsxwriter in constant memory mode. Every
+    row is flushed to disk as soon as the next one starts, so frames are
+    written row by row and memory does not grow with the report. Sheets
+    look like the ones DataFrame.to_excel writes."""
+
+    def __init__(self, path):
+        self.path = path
+        self.workbook = xlsxwriter.Workbook(path, {"constant_memory": True})
+        self.header = self.workbook.add_format(HEADER_FORMAT)
+        self.datetime = self.workbook.add_format(
+                {"num_format": DATETIME_FORMAT})
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.workbook.close()
+
+    def write(self, sheet, row, col, value, cell_format=None):
+        if value is None:
+            return
+        if isinstance(value, datetime):
+            sheet.write_datetime(
+                    row, col, value, cell_format or self.datetime)
+        elif isinstance(value, str):
+            sheet.write_string(row, col, value, cell_format)
+        else:
+            sheet.write(row, col, value, cell_format)
+
+    def write_frame(self, data, sheet_name):
+        """ Write "data" with its index to a new sheet."""
+
+        sheet = self.workbook.add_worksheet(sheet_name)
+        for col, name in enumerate(data.columns, start=1):
+            sheet.write_string(0, col, str(name), self.header)
+
+        # Rows must be written in order, so columns are converted first
+        # and then walked row by row.
+        columns = [cells(data.index)]
+        columns += [cells(data.iloc[:, i]) for i in range(data.shape[1])]
+        for row, values in enumerate(zip(*columns), start=1):
+            self.write(sheet, row, 0, values[0], self.header)
+            for col, value in enumerate(values[1:], start=1):
+                self.write(sheet, row, col, value)
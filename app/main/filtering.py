@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+
+# Columns tests can be filtered by and the type of their values.
+FILTER_COLUMNS = {"profile_id": int, "type": str, "site": str, "res": str}
+
+# Bounds of the date range, both included, as "YYYY-MM-DD".
+RANGE_KEYS = ["start", "end"]
+
+def is_unset(value):
+    # "None" is how the filters form used to say "All".
+    return value is None or value == "None" or value == ""
+
+def normalize_filters(filters):
+    """ Canonical form of a filter spec: a sorted list of typed values
+    per column and the date range bounds. Single values, the format of
+    older sessions, are accepted. Raise ValueError on unknown keys or
+    invalid values."""
+
+    spec = {}
+    for key, value in (filters or {}).items():
+        if key in RANGE_KEYS:
+            if not is_unset(value):
+                spec[key] = pd.Timestamp(value).strftime("%Y-%m-%d")
+        elif key in FILTER_COLUMNS:
+            if not isinstance(value, (list, tuple)):
+                value = [value]
+            values = {
+                    FILTER_COLUMNS[key](item) for item in value
+                    if not is_unset(item)}
+            if values:
+                spec[key] = sorted(values)
+        else:
+            raise ValueError("Unknown filter: {}".format(key))
+    return spec
+
+def column_mask(column, values):
+    """ Mask of the rows of "column" holding one of "values". Categorical
+    columns are looked up by code instead of comparing every value."""
+
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        wanted = column.cat.categories.get_indexer(values)
+
+        # Missing values have code -1 and land on the last, unset, entry.
+        lookup = np.zeros(len(column.cat.categories) + 1, dtype=bool)
+        lookup[wanted[wanted >= 0]] = True
+        return lookup[column.cat.codes.to_numpy()]
+    return column.isin(values).to_numpy()
+
+class CompiledFilters:
+    """ A filter spec compiled into a single boolean mask. Every filtered
+    column is read once, whatever the number of values selected."""
+
+    def __init__(self, filters):
+        self.spec = normalize_filters(filters)
+        self.values = {
+                key: value for key, value in self.spec.items()
+                if key in FILTER_COLUMNS}
+
+        self.start = self.end = None
+        if "start" in self.spec:
+            self.start = pd.Timestamp(self.spec["start"]).to_datetime64()
+        if "end" in self.spec:
+            self.end = (pd.Timestamp(self.spec["end"])
+                    + pd.Timedelta(days=1)).to_datetime64()
+
+    def __bool__(self):
+        return bool(self.spec)
+
+    def fits(self, columns, time_column="timestamp"):
+        """ Whether a frame with "columns" holds every filtered column."""
+
+        needed = list(self.values)
+        if self.start is not None or self.end is not None:
+            needed.append(time_column)
+        return all(column in columns for column in needed)
+
+    def mask(self, data, time_column="timestamp"):
+        """ Mask of the rows of "data" matching the filters. Dates are
+        compared against "time_column"."""
+
+        mask = np.ones(len(data), dtype=bool)
+        for column, values in self.values.items():
+            mask &= column_mask(data[column], values)
+
+        if self.start is not None or self.end is not None:
+            times = data[time_column].to_numpy()
+            if self.start is not None:
+                mask &= times >= self.start
+            if self.end is not None:
+                mask &= times < self.end
+        return mask
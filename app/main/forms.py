@@ -1,25 +1,35 @@
 from flask_wtf import FlaskForm
 from flask_wtf.file import FileField, FileRequired
-from wtforms import SubmitField, SelectField, BooleanField, TextAreaField
-from wtforms.validators import DataRequired, Length
+from wtforms import SubmitField, BooleanField, TextAreaField
+from wtforms import SelectMultipleField, DateField
+from wtforms.validators import Length, Optional
 
 from werkzeug.utils import secure_filename
 
 class DataForm(FlaskForm):
     op_file = FileField('Operativos', validators=[FileRequired()])
     non_op_file = FileField('No operativos', validators=[FileRequired()])
+    append = BooleanField('Append to loaded data')
     submit = SubmitField('Upload')
 
+class LocationsForm(FlaskForm):
+    locations_file = FileField('Ubicaciones', validators=[FileRequired()])
+    submit = SubmitField('Replace')
+
 class FilterForm(FlaskForm):
-    profile = SelectField('Perfil', validators=[DataRequired()],
+    # Nothing selected means all of them.
+    profile = SelectMultipleField('Perfil', coerce=int,
             choices=[(12, '12x3'),(15, '15x3.75'),(18, '18x4.5'),
-                (21, '21x5.25'), (None, 'All')])
-    test_type = SelectField('Tipo', validators=[DataRequired()],
+                (21, '21x5.25')])
+    test_type = SelectMultipleField('Tipo',
             choices=[
                     ("scheduled", 'Scheduled'),
                     ("monitoring", 'Monitoring'),
-                    ("on-demand", 'On Demand'), 
-                    (None, 'All')])
+                    ("on-demand", 'On Demand')])
+    start = DateField('Desde', validators=[Optional()])
+    end = DateField('Hasta', validators=[Optional()])
+    sites = TextAreaField(
+            'Sites', validators=[Optional(), Length(max=5000)])
     submit = SubmitField('Filter')
 
 class ComplianceForm(FlaskForm):
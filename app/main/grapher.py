@@ -1,44 +1,211 @@
+import hashlib
+import re
+import threading
+import time
+import uuid
+from collections import deque
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
+import matplotlib
 import os
 
+matplotlib.use("Agg")
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
 from flask import current_app
 
-class Grapher:
+from app.main.diskcache import evict_lru
+from app.main.pools import WorkerPool
+from app.main.timing import stage
+
+# Render time and memory of the last charts rendered by this process.
+render_stats = deque(maxlen=100)
+
+# Seconds a chart request waits for the render of its chart.
+CHART_WAIT_SECONDS = 60
+
+# Process pool rendering the charts of this process.
+render_pool = WorkerPool()
+
+# Renders in flight in this process by chart path, so requests for the
+# same chart share one render.
+_rendering = {}
+_rendering_lock = threading.Lock()
+
+def rss_bytes():
+    """ Resident memory of this process, or None where /proc is
+    missing."""
+
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+def draw_progress_scatter(fig, data, dot_size=5):
+    colors = np.where(data["pass"], "DarkBlue", "Red")
+    plot_data = data.assign(c=colors)
+
+    axs = fig.subplots()
+    plot_data.plot.scatter(ax=axs, x="x", y="y", c="c", s=dot_size)
+
+    axs.set_ylabel("throughput")
+    axs.set_xlabel("timestamp")
+
+def draw_progress_stacked_area(fig, data):
+    axs = fig.subplots()
+    data.plot.area(ax=axs, linewidth=0.5)
+    axs.set_ylabel("number of failed tests")
+    axs.set_xlabel("timestamp (res=1hr)")
+
+    # Shrink current axis by 20%
+    box = axs.get_position()
+    axs.set_position([box.x0, box.y0, box.width * 0.8, box.height])
+
+    # Put a legend to the right of the current axis
+    axs.legend(loc='center left', bbox_to_anchor=(1, 0.5))
+
+DRAWERS = {
+        "progress_scatter": draw_progress_scatter,
+        "progress_stacked_area": draw_progress_stacked_area}
+
+def render_chart(kind, data, params, path):
+    """ Render a chart to "path" and measure it. Runs in the render
+    pool. The figure is drawn by Agg and never registered with pyplot,
+    so it is freed as soon as it is cleared.
 
-    def progress_scatter(data, path, dot_size=5):
+    The chart is written under a name of its own and moved in place, so
+    workers rendering the same chart at once never share a file: the
+    last one to finish replaces an identical chart."""
 
-        def apply_color(row):
-            return "Red" if not row["pass"] else "DarkBlue"
-        data["c"] = data.apply(lambda row: apply_color(row), axis=1)
+    start = time.perf_counter()
+    rss_before = rss_bytes()
 
-        fig, axs = plt.subplots(figsize=(20, 6))
-        data.plot.scatter(
-                ax=axs, x="x", y="y", c="c", s=dot_size)
+    tmp_path = "{}.{}.tmp".format(path, uuid.uuid4().hex)
+    fig = Figure(figsize=(20, 6))
+    FigureCanvasAgg(fig)
+    try:
+        DRAWERS[kind](fig, data, **params)
+        fig.savefig(tmp_path, format="png")
+        rss_after = rss_bytes()
+        os.replace(tmp_path, path)
+    finally:
+        fig.clear()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
 
-        axs.set_ylabel("throughput")
-        axs.set_xlabel("timestamp")
+    return {
+            "kind": kind,
+            "rows": len(data),
+            "seconds": time.perf_counter() - start,
+            "rss_bytes": rss_after,
+            "rss_delta_bytes": (
+                    rss_after - rss_before if rss_after is not None
+                    else None),
+            "file_bytes": os.path.getsize(path)}
 
-        path = os.path.join(current_app.config["GRAPH_FOLDER"], path)
-        fig.savefig(path)
+def chart_key(kind, data, params):
+    """ Hash of everything a chart depends on: its kind, the render
+    parameters and the plotted data."""
 
-        return True
-        
-    def progress_stacked_area(data, path):
-        fig, axs = plt.subplots(figsize=(20, 6))
-        data.plot.area(ax=axs, linewidth=0.5)
-        axs.set_ylabel("number of failed tests")
-        axs.set_xlabel("timestamp (res=1hr)")
-        
-        # Shrink current axis by 20%
-        box = axs.get_position()
-        axs.set_position([box.x0, box.y0, box.width * 0.8, box.height])
+    h = hashlib.sha1()
+    h.update(kind.encode())
+    h.update(repr(sorted(params.items())).encode())
+    h.update(repr(list(data.columns)).encode())
+    h.update(pd.util.hash_pandas_object(data, index=True).to_numpy())
+    return h.hexdigest()
 
-        # Put a legend to the right of the current axis
-        axs.legend(loc='center left', bbox_to_anchor=(1, 0.5))
+def render_charts(charts):
+    """ Return the names of "charts", a list of (kind, data, params), to
+    be fetched from the chart endpoint. Charts not rendered before are
+    rendered in parallel in the render pool, without waiting for them:
+    the page is sent while they render and each chart request waits for
+    its own."""
 
-        path = os.path.join(current_app.config["GRAPH_FOLDER"], path)
-        fig.savefig(path)
+    with stage("charts"):
+        return render_in_pool(charts)
+
+def submit_render(kind, data, params, path, max_workers):
+    """ Future of the render of the chart at "path", joining the one in
+    flight if this process is rendering it already."""
+
+    with _rendering_lock:
+        future = _rendering.get(path)
+        if future is not None:
+            return future
+        future = render_pool.submit(
+                max_workers, render_chart, kind, data, params, path)
+        _rendering[path] = future
+
+    # Outside the lock: a finished future runs the callback right away.
+    future.add_done_callback(lambda future: finish_render(path, future))
+    return future
+
+def finish_render(path, future):
+    """ Forget a finished render and keep its stats."""
+
+    with _rendering_lock:
+        if _rendering.get(path) is future:
+            del _rendering[path]
+    if future.exception() is None:
+        stats = future.result()
+        stats["chart"] = os.path.basename(path)
+        render_stats.append(stats)
+
+def render_in_pool(charts):
+    folder = current_app.config["CHART_FOLDER"]
+    os.makedirs(folder, exist_ok=True)
+
+    paths = []
+    pending = []
+    for kind, data, params in charts:
+        path = os.path.join(folder, chart_key(kind, data, params) + ".png")
+        paths.append(path)
+        if os.path.exists(path):
+            # Mark as recently used.
+            os.utime(path)
+            continue
+        pending.append(submit_render(
+                kind, data, params, path,
+                current_app.config["RENDER_WORKERS"]))
+
+    if pending:
+        evict_lru(
+                folder, current_app.config["CHART_CACHE_BYTES"],
+                lambda entry: entry.name.endswith(".png"))
+
+    return [os.path.basename(path) for path in paths]
+
+def wait_chart(name, timeout=CHART_WAIT_SECONDS):
+    """ Path of the chart "name", waiting up to "timeout" seconds for its
+    render. Charts rendered by other processes are waited for until
+    their file shows up. Return None if there is no such chart."""
+
+    if not re.fullmatch("[0-9a-f]{40}\\.png", name):
+        return None
+    path = os.path.join(current_app.config["CHART_FOLDER"], name)
+    deadline = time.monotonic() + timeout
+
+    with _rendering_lock:
+        future = _rendering.get(path)
+    if future is not None:
+        try:
+            future.result(timeout=timeout)
+        except Exception:
+            return None
+
+    while not os.path.exists(path):
+        if time.monotonic() >= deadline:
+            return None
+        time.sleep(0.1)
+    return path
+
+class Grapher:
 
-        return True
+    def progress_scatter(data, dot_size=5):
+        return render_charts([
+                ("progress_scatter", data, {"dot_size": dot_size})])[0]
 
+    def progress_stacked_area(data):
+        return render_charts([("progress_stacked_area", data, {})])[0]
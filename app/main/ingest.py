@@ -0,0 +1,183 @@
+import codecs
+import csv
+import gzip
+import time
+from concurrent.futures import ProcessPoolExecutor
+from operator import itemgetter
+
+import openpyxl
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv
+
+from app.main.reporter import EXCEL_KEY_MAPPING
+from app.main.reporter import rename_gestionate, parse_gestionate
+
+TICKET_COLUMNS = [
+        "ID_BENEFICIARIO", "FECHA_HORA_DE_APERTURA",
+        "FECHA_HORA_DE_RESOLUCION"]
+
+# Text columns of gestionate exports. Read from CSV, they would be
+# inferred as numbers or dates, unlike workbook cells. Numbers are
+# inferred like cells: ints unless some value has decimals.
+GESTIONATE_TYPES = {
+        "Ubicación": pa.string(),
+        "Resultado": pa.string(),
+        "Fecha de la Prueba": pa.string(),
+        "Perfil de Velocidad": pa.string(),
+        "Tipo de prueba": pa.string(),
+        "Tipo de Prueba": pa.string(),
+        "Error": pa.string()}
+
+# Bytes CSV headers are looked for in.
+CSV_SAMPLE_BYTES = 64*1024
+
+def file_format(path):
+    """ Format of a file from its first bytes: "xlsx", "csv.gz" or "csv".
+    Raise ValueError for other binary formats, eg: old .xls files."""
+
+    with open(path, "rb") as f:
+        magic = f.read(8)
+    if magic.startswith(b"PK\x03\x04"):
+        return "xlsx"
+    if magic.startswith(b"\x1f\x8b"):
+        return "csv.gz"
+    if magic.startswith(b"\xd0\xcf\x11\xe0") or b"\x00" in magic:
+        raise ValueError("Unsupported file format: {}".format(path))
+    return "csv"
+
+def read_columns(path, columns, sheet_name=0, header=0, types=None):
+    """ Read "columns" of a workbook or a CSV file, gzipped or not. The
+    format is detected from the content, not the extension. Columns
+    missing from the file are skipped. See read_sheet_columns and
+    read_csv_columns."""
+
+    if file_format(path) == "xlsx":
+        return read_sheet_columns(path, columns, sheet_name, header)
+    return read_csv_columns(path, columns, types)
+
+def read_csv_columns(path, columns, types=None):
+    """ Read "columns" of a CSV file with the multithreaded arrow reader.
+    The header is the first line naming one of "columns", so title lines
+    before it are skipped. The delimiter and the encoding, UTF-8 or
+    Latin-1, are detected from that line. "types" forces the arrow type
+    of some columns."""
+
+    compression = "gzip" if file_format(path) == "csv.gz" else None
+    with (gzip.open if compression else open)(path, "rb") as f:
+        sample = f.read(CSV_SAMPLE_BYTES)
+
+    try:
+        codecs.getincrementaldecoder("utf-8")().decode(sample)
+        encoding = "utf8"
+    except UnicodeDecodeError:
+        encoding = "latin-1"
+    lines = sample.decode(encoding, errors="replace").splitlines()
+    if lines:
+        lines[0] = lines[0].lstrip("\ufeff")
+
+    for skip, line in enumerate(lines):
+        delimiter = max([",", ";", "\t"], key=line.count)
+        names = next(csv.reader([line], delimiter=delimiter), [])
+        found = [name for name in columns if name in names]
+        if found:
+            break
+    else:
+        return pd.DataFrame()
+
+    # Only empty fields are missing values, like empty cells.
+    table = pyarrow.csv.read_csv(
+            pa.input_stream(path, compression=compression),
+            read_options=pyarrow.csv.ReadOptions(
+                    skip_rows=skip, encoding=encoding, use_threads=True),
+            parse_options=pyarrow.csv.ParseOptions(delimiter=delimiter),
+            convert_options=pyarrow.csv.ConvertOptions(
+                    include_columns=found,
+                    column_types={
+                            name: kind
+                            for name, kind in (types or {}).items()
+                            if name in found},
+                    null_values=[""], strings_can_be_null=True))
+
+    # Blank rows are skipped, like read_excel does.
+    data = table.to_pandas()
+    return data.dropna(how="all").reset_index(drop=True)
+
+def read_sheet_columns(path, columns, sheet_name=0, header=0):
+    """ Stream the rows of a worksheet and keep only "columns". "header"
+    is the row of the column names, "sheet_name" a name or a position.
+    Columns missing from the sheet are skipped."""
+
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        if isinstance(sheet_name, int):
+            sheet = workbook.worksheets[sheet_name]
+        else:
+            sheet = workbook[sheet_name]
+        rows = sheet.iter_rows(values_only=True)
+        for _ in range(header):
+            next(rows)
+        names = next(rows)
+
+        found = [name for name in columns if name in names]
+        if not found:
+            return pd.DataFrame()
+        positions = [names.index(name) for name in found]
+        get = itemgetter(*positions)
+
+        # Sheets saved without dimensions, eg: by streaming writers, 
+        # skip the empty cells at the end of each row.
+        last = max(positions)
+        pad = (None,)*(last + 1)
+
+        # itemgetter returns a scalar, not a tuple, for one column.
+        if len(positions) == 1:
+            values = [
+                    (get(row if len(row) > last else row + pad),)
+                    for row in rows]
+        else:
+            values = [
+                    get(row if len(row) > last else row + pad)
+                    for row in rows]
+    finally:
+        workbook.close()
+
+    # Blank rows are skipped, like read_excel does.
+    data = pd.DataFrame.from_records(values, columns=found)
+    return data.dropna(how="all").reset_index(drop=True)
+
+def read_gestionate(path, sheet_name="ReportSheet", header=1):
+    """ Read the mapped columns of a gestionate export, renamed. The
+    export can be a workbook or a CSV file."""
+
+    data = read_columns(
+            path, list(EXCEL_KEY_MAPPING), sheet_name, header,
+            GESTIONATE_TYPES)
+    return rename_gestionate(data)
+
+def read_gestionate_files(paths, sheet_name="ReportSheet", header=1):
+    """ Read several gestionate exports in parallel and return the
+    cleaned tests of all of them, plus parse statistics."""
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=len(paths)) as executor:
+        parts = list(executor.map(
+                read_gestionate, paths,
+                [sheet_name]*len(paths), [header]*len(paths)))
+
+    data = pd.concat(parts, ignore_index=True, axis=0)
+    rows = len(data)
+    data = parse_gestionate(data)
+
+    seconds = time.perf_counter() - start
+    stats = {
+            "rows": rows,
+            "duplicates": rows - len(data),
+            "seconds": seconds,
+            "rows_per_s": rows/seconds if seconds else 0}
+    return data, stats
+
+def read_tickets(path):
+    """ Read the columns of a tickets export used by the report."""
+
+    return read_columns(path, TICKET_COLUMNS, sheet_name=0, header=0)
@@ -0,0 +1,213 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import traceback
+import uuid
+from datetime import datetime
+
+from app.main.reporter import Reporter, get_compliance_report
+from app.main.reporter import MIN_TEST_QTY, TKT_TEST_QTY
+from app.main.ingest import read_gestionate_files, read_tickets
+from app.main.diskcache import evict_lru
+from app.main.locations import locations
+from app.main.pools import WorkerPool
+from config import Config
+
+# Stages a compliance job goes through, in order.
+STAGES = ["parse", "filter", "tickets", "compliance", "write"]
+
+# Process pool shared by all the jobs of this process.
+job_pool = WorkerPool()
+
+def job_path(job_folder, job_id):
+    if not re.fullmatch("[0-9a-f]{32}", job_id):
+        raise KeyError(job_id)
+    return os.path.join(job_folder, job_id + ".json")
+
+def read_job(job_folder, job_id):
+    """ Return the state of a job. Raise KeyError if it does not exist."""
+
+    try:
+        with open(job_path(job_folder, job_id)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        raise KeyError(job_id)
+
+def write_job(job_folder, job):
+    """ Save the state of a job. The file is replaced atomically so
+    readers never see it half written."""
+
+    job["updated"] = datetime.now().isoformat(timespec="seconds")
+    path = job_path(job_folder, job["id"])
+    with open(path + ".tmp", "w") as f:
+        json.dump(job, f)
+    os.replace(path + ".tmp", path)
+
+def report_key(paths, remove_ids, types, thresholds, ids):
+    """ Hash of everything a compliance report depends on: the content of
+    the input workbooks, the removed VSAT ids, the test types, the
+    thresholds and the location ids sites are filtered by."""
+
+    digest = hashlib.sha1()
+    for path in paths:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024*1024), b""):
+                digest.update(chunk)
+        digest.update(str(os.path.getsize(path)).encode())
+    digest.update(json.dumps([
+            sorted({vsat for vsat in remove_ids if vsat}),
+            sorted(set(types)), list(thresholds)]).encode())
+    digest.update(ids.tobytes())
+    return digest.hexdigest()
+
+def cached_report(cache_folder, key):
+    """ Path of the report stored under "key", or None."""
+
+    folder = os.path.join(cache_folder, key)
+    try:
+        files = os.listdir(folder)
+    except FileNotFoundError:
+        return None
+    if not files:
+        return None
+
+    # The folder time tells which reports were used last.
+    os.utime(folder)
+    return os.path.join(folder, files[0])
+
+def store_report(cache_folder, key, write):
+    """ Write a report with write(folder) into a temporary folder and
+    move it under "key". Return the path of the stored report."""
+
+    folder = os.path.join(cache_folder, key)
+    tmp_folder = "{}.{}.tmp".format(folder, uuid.uuid4().hex)
+    os.makedirs(tmp_folder)
+    try:
+        path = write(tmp_folder)
+        os.rename(tmp_folder, folder)
+    except OSError:
+        # Another job stored the same report first.
+        shutil.rmtree(tmp_folder, ignore_errors=True)
+        path = cached_report(cache_folder, key)
+        if path is None:
+            raise
+        return path
+    except BaseException:
+        shutil.rmtree(tmp_folder, ignore_errors=True)
+        raise
+    return os.path.join(folder, os.path.basename(path))
+
+def run_compliance(op_path, non_op_path, tickets_path, remove_ids, types,
+        report_folder, progress):
+    """ Parse the uploaded workbooks, keep the valid tests and write the
+    compliance report. Return the report path. Reports are cached under
+    a hash of their inputs, so a repeated run returns the stored one."""
+
+    cache_folder = os.path.join(report_folder, "cache")
+    key = report_key(
+            [op_path, non_op_path, tickets_path], remove_ids, types,
+            [MIN_TEST_QTY, TKT_TEST_QTY], locations.get()[0])
+    path = cached_report(cache_folder, key)
+    if path is not None:
+        return path
+
+    def write(folder):
+        return write_compliance(
+                op_path, non_op_path, tickets_path, remove_ids, types,
+                folder, progress)
+
+    os.makedirs(cache_folder, exist_ok=True)
+    path = store_report(cache_folder, key, write)
+    evict_lru(
+            cache_folder, Config.REPORT_CACHE_BYTES,
+            lambda entry: entry.is_dir() and not entry.name.endswith(".tmp"))
+    return path
+
+def write_compliance(op_path, non_op_path, tickets_path, remove_ids, types,
+        report_folder, progress):
+    """ Write the compliance report of the workbooks, uncached."""
+
+    progress("parse")
+    test_data, stats = read_gestionate_files(
+            [op_path, non_op_path], sheet_name=0)
+    tickets_data = read_tickets(tickets_path)
+
+    progress("filter", rows=stats["rows"], rows_per_s=stats["rows_per_s"])
+    reporter = Reporter(test_data)
+    filtered_data = reporter.filter_sites(locations.get()[0])
+
+    filtered_data = filtered_data[
+            (filtered_data["res"] == "succeeded")
+            & ~filtered_data["site"].isin(remove_ids)
+            & filtered_data["type"].isin(types)]
+
+    return get_compliance_report(
+            filtered_data, tickets_data, report_folder, progress)
+
+def run_compliance_job(job_folder, job_id, params):
+    """ Run a compliance job, recording its progress in the job file."""
+
+    job = read_job(job_folder, job_id)
+
+    def progress(stage, **info):
+        job.update({"status": "running", "stage": stage, "info": info})
+        write_job(job_folder, job)
+
+    try:
+        path = run_compliance(progress=progress, **params)
+    except Exception as e:
+        fail_job(job_folder, job, e)
+        return
+
+    job.update({
+            "status": "done", "stage": "write", "info": {},
+            "file": os.path.relpath(path, params["report_folder"])})
+    write_job(job_folder, job)
+
+def submit_compliance_job(job_folder, max_workers, **params):
+    """ Queue a compliance job and return its id. "params" are the
+    arguments of run_compliance."""
+
+    os.makedirs(job_folder, exist_ok=True)
+    job = {
+            "id": uuid.uuid4().hex,
+            "status": "queued",
+            "stage": None,
+            "stages": STAGES,
+            "info": {},
+            "file": None,
+            "error": None,
+            "created": datetime.now().isoformat(timespec="seconds")}
+    write_job(job_folder, job)
+    try:
+        future = job_pool.submit(
+                max_workers, run_compliance_job, job_folder, job["id"],
+                params)
+    except Exception as e:
+        fail_job(job_folder, job, e)
+        return job["id"]
+
+    future.add_done_callback(
+            lambda future: job_finished(job_folder, job["id"], future))
+    return job["id"]
+
+def fail_job(job_folder, job, error):
+    job.update({
+            "status": "failed",
+            "error": str(error) or type(error).__name__,
+            "traceback": "".join(traceback.format_exception(
+                    type(error), error, error.__traceback__))})
+    write_job(job_folder, job)
+
+def job_finished(job_folder, job_id, future):
+    """ Mark a job failed when its worker did not finish it, eg: the
+    worker died while running it."""
+
+    error = future.exception()
+    if error is None:
+        return
+    job = read_job(job_folder, job_id)
+    if job["status"] not in ["done", "failed"]:
+        fail_job(job_folder, job, error)
@@ -0,0 +1,70 @@
+import os
+import shutil
+import threading
+
+import numpy as np
+import pandas as pd
+
+from app.main.reporter import in_sorted, known_sites
+
+LOCATIONS_PATH = "data_sets/locations.pkl"
+
+# Name of the locations column in the exports they come from.
+LOCATIONS_NAME = "ID Beneficiario"
+
+class LocationsRegistry:
+    """ Location ids of the monitored sites, loaded once per process as a
+    sorted array of unique ints and reloaded whenever the file changes."""
+
+    def __init__(self, path):
+        self.path = path
+        self.ids = np.empty(0, dtype=np.int64)
+        self.version = None
+        self.lock = threading.Lock()
+
+    def get(self):
+        """ Return the sorted location ids and the version of the file
+        they were read from."""
+
+        version = os.stat(self.path).st_mtime_ns
+        with self.lock:
+            if version != self.version:
+                ids = pd.read_pickle(self.path).to_numpy(dtype=np.int64)
+                self.ids = np.unique(ids)
+                self.version = version
+            return self.ids, self.version
+
+    def contains(self, locations):
+        """ Vectorized membership test of location ids."""
+
+        return in_sorted(locations, self.get()[0])
+
+    def contains_sites(self, sites):
+        """ Vectorized membership test of site ids, eg: "39302-1"."""
+
+        return known_sites(sites, self.get()[0])
+
+    def replace(self, ids):
+        """ Save new location ids. The previous file is kept as a backup
+        and the new one is moved in place atomically."""
+
+        ids = pd.Series(np.unique(ids), name=LOCATIONS_NAME)
+        if os.path.exists(self.path):
+            shutil.copy2(self.path, self.path + ".bkp")
+        ids.to_pickle(self.path + ".tmp")
+        os.replace(self.path + ".tmp", self.path)
+
+locations = LocationsRegistry(LOCATIONS_PATH)
+
+def read_locations(path):
+    """ Read location ids from the first column of a workbook. Site ids,
+    eg: "39302-1", are reduced to their location. Raise ValueError if a
+    value is not a location."""
+
+    values = pd.read_excel(path, usecols=[0]).iloc[:, 0].dropna()
+    values = values.astype(str).str.split("-", n=1).str[0].str.strip()
+    ids = pd.to_numeric(values, errors="coerce")
+    if ids.isna().any() or not len(ids):
+        raise ValueError("Invalid location ids: {}".format(
+                ", ".join(values[ids.isna()][:5])))
+    return ids.astype(np.int64).to_numpy()
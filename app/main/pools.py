@@ -0,0 +1,32 @@
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+class WorkerPool:
+    """ Process pool of this process, created on first use. A worker that
+    dies, eg: killed out of memory, breaks the pool for good: every
+    later task is refused. The broken pool is then dropped and the task
+    goes to a new one."""
+
+    def __init__(self):
+        self.executor = None
+        self.lock = threading.Lock()
+
+    def get(self, max_workers):
+        with self.lock:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(max_workers=max_workers)
+            return self.executor
+
+    def submit(self, max_workers, fn, *args):
+        """ Run fn(*args) in the pool and return its future."""
+
+        executor = self.get(max_workers)
+        try:
+            return executor.submit(fn, *args)
+        except BrokenProcessPool:
+            with self.lock:
+                if self.executor is executor:
+                    self.executor = None
+            executor.shutdown(wait=False)
+            return self.get(max_workers).submit(fn, *args)
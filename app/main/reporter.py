@@ -12,54 +12,286 @@ EXCEL_KEY_MAPPING = {
         "Tipo de Prueba": "type",
         "Error": "error"}
 
+# Columns identifying a test, used to find duplicates.
+TEST_KEY = ['site', 'dn_br', 'up_br', 'timestamp', 'hour']
+
+# Columns with few distinct values, kept in memory as categoricals.
+CATEGORY_COLUMNS = ['site', 'profile', 'type', 'res', 'error']
+
+# Days of tests the trend of a site compares against the older ones.
+TREND_DAYS = 7
+
+# Tests a site needs for its tests to count in the compliance report,
+# and the tests it needs when it had tickets open for a day or more.
+MIN_TEST_QTY = 30
+TKT_TEST_QTY = 15
+
 import pandas as pd
 import numpy as np
 from datetime import datetime
 from werkzeug.utils import secure_filename
 from flask import current_app
 import os
+import logging
+
+from app.main.filtering import CompiledFilters
+from app.main.excel import StreamWriter
+from app.main.timeindex import TimeIndex
+from app.main.siteindex import SiteIndex
+
+logger = logging.getLogger(__name__)
+
+def site_location(sites):
+    """ Parse the location bit of site ids, eg: "39302-1" -> 39302."""
+
+    return sites.str.split("-", n=1).str[0].astype(int)
+
+def in_sorted(values, ids):
+    """ Vectorized membership test of "values" in "ids", a sorted array
+    of unique ints."""
+
+    values = np.asarray(values, dtype=np.int64)
+    if not len(ids):
+        return np.zeros(len(values), dtype=bool)
+    pos = np.searchsorted(ids, values).clip(max=len(ids) - 1)
+    return ids[pos] == values
+
+def known_sites(sites, ids):
+    """ Mask of the site ids located in "ids", a sorted array of unique
+    location ids. Each distinct site id is parsed once."""
+
+    if isinstance(sites.dtype, pd.CategoricalDtype):
+        codes, uniques = sites.cat.codes.to_numpy(), sites.cat.categories
+    else:
+        codes, uniques = pd.factorize(sites)
+    return in_sorted(site_location(pd.Series(uniques)), ids)[codes]
+
+def short_error(errors):
+    """ Truncate long error messages so they can be used as labels."""
+
+    # Categorical errors are truncated once per distinct message.
+    if isinstance(errors.dtype, pd.CategoricalDtype):
+        short = np.full(len(errors.cat.categories) + 1, np.nan, dtype=object)
+        if len(errors.cat.categories):
+            short[:-1] = short_error(pd.Series(errors.cat.categories))
+        # Missing errors have code -1 and land on the last, NaN, entry.
+        return pd.Series(
+                short[errors.cat.codes.to_numpy()],
+                index=errors.index, dtype=object)
+
+    long = errors.str.len() > 75
+    return errors.where(~long, errors.str[:40] + "..")
+
+def eval_direction(data, direction):
+    """ A test passes in a direction if the found bit rate is not below
+    the expected one."""
+
+    expected = data["exp_" + direction + "_br"]
+    found = data[direction + "_br"]
+    return ~(expected > found)
+
+# Grouping keys derived from the timestamp. Do not use "hour" column, it
+# has been found to have invalid info.
+TIME_KEYS = {
+        "day": lambda data: pd.Grouper(key="timestamp", freq="D"),
+        "hour": lambda data: data["timestamp"].dt.hour.rename("hour")}
+
+def aggregate_tests(data, by, **extra):
+    """ Count evaluated tests and the % of them failed on download and
+    upload for every group of "by" in a single groupby pass. "by" is a
+    list of "day", "hour" or column names, eg: "site", "profile", "type".
+    "extra" holds additional named aggregations placed first."""
+
+    keys = [TIME_KEYS[key](data) if key in TIME_KEYS else key
+            for key in by]
+    data = data.assign(dn_fail=~data["dn_pass"], up_fail=~data["up_pass"])
+    res = data.groupby(keys, observed=True).agg(
+            **extra,
+            count=("dn_fail", "size"),
+            dn_fail=("dn_fail", "sum"),
+            up_fail=("up_fail", "sum"))
+
+    # Categorical keys are not sorted when only observed ones are kept.
+    res = res.sort_index()
+    res["dn_fail"] = 100*res["dn_fail"]/res["count"]
+    res["up_fail"] = 100*res["up_fail"]/res["count"]
+    return res.reset_index()
+
+# Grain of the rollup cube. "err" is the short error of failed tests.
+ROLLUP_GRAIN = ["site", "day", "hour", "profile_id", "type", "res", "err"]
+
+def rollup_tests(data):
+    """ Pre-aggregate tests at the grain of ROLLUP_GRAIN: the count of
+    tests, of the ones passed on download, upload and both, and the sum
+    of found bit rates. "profile" and "position" are those of the first
+    test of each cell."""
+
+    failed = data["res"] == "failed"
+    err = pd.Series(np.nan, index=data.index, dtype=object)
+    if failed.any():
+        err[failed] = short_error(data.loc[failed, "error"])
+
+    dn_pass = eval_direction(data, "dn")
+    up_pass = eval_direction(data, "up")
+    data = data.assign(
+            day=data["timestamp"].dt.floor("D"),
+            hour=data["timestamp"].dt.hour.astype("int8"),
+            err=err,
+            dn_pass=dn_pass,
+            up_pass=up_pass,
+            passed=dn_pass & up_pass,
+            position=np.arange(len(data)))
+
+    cube = data.groupby(
+            ROLLUP_GRAIN, dropna=False, sort=False, observed=True).agg(
+            profile=("profile", "first"),
+            position=("position", "min"),
+            count=("dn_pass", "size"),
+            dn_pass=("dn_pass", "sum"),
+            up_pass=("up_pass", "sum"),
+            passed=("passed", "sum"),
+            dn_br_sum=("dn_br", "sum"),
+            up_br_sum=("up_br", "sum"))
+    return cube.rename(columns={"passed": "pass"}).reset_index()
 
 class Reporter:
 
-    def __init__(self, data):
+    def __init__(self, data, rollup=None):
         self.test_data = data
+        self.rollup = rollup
+        self.indexes = {}
 
     def filter_sites(self, sites):
         """ Remove all tests from sites not included in "sites" var."""
 
-        sites = sites.drop_duplicates()
+        ids = np.unique(np.asarray(sites, dtype=np.int64))
 
         # Remove unused data from site id. "Locations" only includes the 
-        # location bit in the site id. 
+        # location bit in the site id. Tests are only copied if some of
+        # them are removed.
         data = self.test_data
-        data["clean_loc"] = data.apply(
-                lambda row: int(row.site.split("-")[0]), axis=1)
-
-        filtered = data[data["clean_loc"].isin(sites)]
-
-        self.filtered = filtered.drop(columns=["clean_loc"])
+        known = known_sites(data["site"], ids)
+        self.filtered = data if known.all() else data.take(
+                np.flatnonzero(known))
+        self.indexes = {}
+        if self.rollup is not None:
+            self.rollup = self.rollup[known_sites(self.rollup["site"], ids)]
         return self.filtered
 
     def apply_filters(self, filters):
-        df1 = self.evaluated
-        df2 = self.filtered
-        for key, value in filters.items():
-            if value == "None":
-                continue
-            try:
-                value = int(value)
-            except Exception as e:
-                value = value
-            df1 = df1[df1[key]==value]
-            try:
-                df2 = df2[df2[key]==value]
-            except Exception as e:
-                df2 = df2
-        self.evaluated = df1
-        self.filtered = df2
+        """ Keep the tests matching a filter spec, see normalize_filters.
+        The spec is compiled into one mask over the filtered tests, which
+        the evaluated ones share."""
+
+        engine = CompiledFilters(filters)
+        if not engine:
+            return self.evaluated
+
+        mask = engine.mask(self.filtered)
+        self.evaluated = self.evaluated[mask[self.succeeded]]
+        self.filtered = self.filtered[mask]
+        self.succeeded = self.succeeded[mask]
+        self.indexes = {}
+
+        if self.rollup is not None:
+            if engine.fits(self.rollup.columns, "day"):
+                self.rollup = self.rollup[engine.mask(self.rollup, "day")]
+            else:
+                self.rollup = None
         return self.evaluated
-            
+
+    def time_index(self, name="evaluated"):
+        """ TimeIndex of the "filtered" or "evaluated" tests, built on
+        first use."""
+
+        index = self.indexes.get(("time", name))
+        if index is None:
+            index = TimeIndex(getattr(self, name)["timestamp"])
+            self.indexes[("time", name)] = index
+        return index
+
+    def site_index(self):
+        """ SiteIndex of the evaluated tests, built on first use."""
+
+        index = self.indexes.get(("site", "evaluated"))
+        if index is None:
+            index = SiteIndex(self.evaluated["site"])
+            self.indexes[("site", "evaluated")] = index
+        return index
+
+    def select_dates(self, start=None, end=None):
+        """ New reporter with the tests from the "start" day to the "end"
+        day, both included, sliced through the time indexes."""
+
+        end = None if end is None else (
+                pd.Timestamp(end) + pd.Timedelta(days=1))
+        filtered = self.time_index("filtered").between(start, end)
+        evaluated = self.time_index("evaluated").between(start, end)
+
+        reporter = Reporter(None)
+        reporter.filtered = self.filtered.take(filtered)
+        reporter.evaluated = self.evaluated.take(evaluated)
+        reporter.succeeded = self.succeeded[filtered]
+        if self.rollup is not None:
+            days = self.rollup["day"]
+            keep = np.ones(len(days), dtype=bool)
+            if start is not None:
+                keep &= (days >= pd.Timestamp(start)).to_numpy()
+            if end is not None:
+                keep &= (days < end).to_numpy()
+            reporter.rollup = self.rollup[keep]
+        return reporter
+
+    def get_day(self, date):
+        """ Evaluated tests of "date"."""
+
+        return self.evaluated.take(self.time_index().day(date))
+
+    def get_site(self, site):
+        """ Evaluated tests of "site"."""
+
+        return self.evaluated.take(self.site_index().positions(site))
+
+    def get_site_summaries(self, sites, trend_days=TREND_DAYS):
+        """ Summary of the evaluated tests of each of "sites": the number
+        of tests, the last one and whether it passed, the % passed and
+        the trend, the change of the % passed in the last "trend_days"
+        days before the last test against the tests before them."""
+
+        index = self.site_index()
+        times = self.evaluated["timestamp"].to_numpy()
+        passed = self.evaluated["pass"].to_numpy()
+        window = np.timedelta64(trend_days, "D")
+
+        res = []
+        for site in sites:
+            positions = index.positions(site)
+            summary = {
+                    "site": site, "tests": len(positions),
+                    "last_test": None, "last_pass": None,
+                    "pass_rate": None, "trend": None}
+            res.append(summary)
+            if not len(positions):
+                continue
+
+            site_times = times[positions]
+            site_passed = passed[positions]
+            last = site_times.argmax()
+            recent = site_times > site_times[last] - window
+            summary.update({
+                    "last_test": pd.Timestamp(site_times[last]).isoformat(),
+                    "last_pass": bool(site_passed[last]),
+                    "pass_rate": 100*site_passed.mean()})
+            if recent.any() and not recent.all():
+                summary["trend"] = 100*(
+                        site_passed[recent].mean()
+                        - site_passed[~recent].mean())
+        return res
+
     def get_summary(self):
+        if self.rollup is not None:
+            return self.get_rollup_summary()
+
         res = {}
         res.update({
             "size": self.filtered.size,
@@ -73,24 +305,41 @@ class Reporter:
 
     def get_failed(self):
         failed = self.filtered[self.filtered["res"] == "failed"]
-        failed["err"] = failed.apply(
-                lambda row: (row.error[:40] + '..') if len(
-                        row.error) > 75 else row.error, axis=1) 
+        failed = failed.assign(err=short_error(failed["error"]))
         df = failed["err"].value_counts()
         df = df.rename_axis("err").to_frame("count")
         top_five = df.sort_values("count", ascending=False)[:5].copy()
         top_five.loc["others"] = df["count"][5:].sum()
         return top_five 
 
+    def get_rollup_summary(self):
+        """ Same as get_summary, counted from the rollup cube. Sizes are
+        in cells, like DataFrame.size."""
+
+        columns = len(self.filtered.columns)
+        count = self.rollup.groupby("res")["count"].sum()
+        return {
+                "size": int(count.sum())*columns,
+                "start": self.rollup["day"].min().date(),
+                "end": self.rollup["day"].max().date(),
+                "failed_qty": int(count.get("failed", 0))*columns,
+                "succeeded_qty": int(count.get("succeeded", 0))*columns}
+
     def get_failed_by_day_hr(self):
         """ This function counts the number of errors of each time
         and groups them by the hour """
 
-        failed = self.filtered[self.filtered["res"] == "failed"]
+        if self.rollup is not None:
+            failed = self.rollup[
+                    (self.rollup["res"] == "failed")
+                    & self.rollup["err"].notna()]
+            hour = failed["day"] + pd.to_timedelta(failed["hour"], "h")
+            return failed.groupby(
+                    [hour.rename("timestamp"), "err"])["count"].sum(
+                            ).rename("err").unstack()
 
-        failed["err"] = failed.apply(
-                lambda row: (row.error[:40] + '..') if len(
-                        row.error) > 75 else row.error, axis=1) 
+        failed = self.filtered[self.filtered["res"] == "failed"]
+        failed = failed.assign(err=short_error(failed["error"]))
         res = failed.set_index(
                 "timestamp").resample('H')['err'].value_counts().unstack()
 
@@ -99,94 +348,209 @@ class Reporter:
     def get_succeeded(self):
         df = self.evaluated["pass"].value_counts()
         df = df.rename_axis("pass").to_frame("count")
-        print(df)
+        logger.debug("Succeeded tests:\n%s", df)
         return df
 
     def eval_tests(self):
         """ Check if test is passed or failed on dowload, upload and both
         directions. Add columns with this information to data."""
 
-        def eval_func(row, direction):
-            expected = getattr(row, "exp_"+direction+"_br")
-            found = getattr(row, direction+"_br")
-            if expected > found:
-                return False 
-            return True
+        # Evaluated tests are the succeeded ones, in the same order.
+        self.succeeded = (self.filtered["res"] == "succeeded").to_numpy()
 
-        # Use eval_func to check tests.
-        data = self.filtered[self.filtered["res"] == "succeeded"]
+        # take returns a new frame, not a view, so it can get the new
+        # columns without a second copy.
+        data = self.filtered.take(np.flatnonzero(self.succeeded))
 
-        data["dn_pass"] = data.apply(
-                lambda row: eval_func(row, "dn"), axis=1)
-        data["up_pass"] = data.apply(
-                lambda row: eval_func(row, "up"), axis=1)
+        data["dn_pass"] = eval_direction(data, "dn")
+        data["up_pass"] = eval_direction(data, "up")
 
         data["pass"] = data.dn_pass & data.up_pass
 
         self.evaluated = data
+        self.indexes = {
+                key: index for key, index in self.indexes.items()
+                if key[1] != "evaluated"}
 
         return data
 
+    def rollup_succeeded(self, by):
+        """ Count succeeded tests and the % of them failed on download
+        and upload for every group of "by", from the rollup cube."""
+
+        succeeded = self.rollup[self.rollup["res"] == "succeeded"]
+        res = succeeded.groupby(by)[["count", "dn_pass", "up_pass"]].sum()
+        res["dn_fail"] = 100*(res["count"] - res.pop("dn_pass"))/res["count"]
+        res["up_fail"] = 100*(res["count"] - res.pop("up_pass"))/res["count"]
+        return succeeded, res
+
     def get_progress(self):
-        df = self.evaluated
-
-        def f(x):
-            d = {}
-            d["count"] = len(x["site"])
-            d["dn_fail"] = 100*len(x[x["dn_pass"]==False])/len(x["site"])
-            d["up_fail"] = 100*len(x[x["up_pass"]==False])/len(x["site"])
-            return pd.Series(d)
-        res = df.set_index(
-                "timestamp").resample("D").apply(f).reset_index()
+        if self.rollup is not None:
+            _, res = self.rollup_succeeded("day")
+
+            # Days without tests are kept, like a daily resample does.
+            if len(res):
+                days = pd.date_range(
+                        res.index.min(), res.index.max(), freq="D")
+                res = res.reindex(days)
+                res["count"] = res["count"].fillna(0).astype(int)
+            return res.rename_axis("timestamp").reset_index()
+
+        res = aggregate_tests(self.evaluated, ["day"])
         return(res)
 
     def get_vsats(self):
-
-        df = self.evaluated
-
-        def f(x):
-            d = {}
-            d["profile"] = x["profile"].unique()[0]
-            d["count"] = len(x["site"])
-            d["dn_fail"] = 100*len(x[x["dn_pass"]==False])/len(x["site"])
-            d["up_fail"] = 100*len(x[x["up_pass"]==False])/len(x["site"])
-            return pd.Series(d)
-        res = df.groupby("site").apply(f).reset_index().sort_values(
-                "up_fail", ascending=False)
+        if self.rollup is not None:
+            succeeded, res = self.rollup_succeeded("site")
+
+            # Profile of the first test of each site.
+            first = succeeded.sort_values("position").drop_duplicates(
+                    "site").set_index("site")["profile"]
+            res.insert(0, "profile", first)
+            return res.reset_index().sort_values(
+                    "up_fail", ascending=False)
+
+        res = aggregate_tests(
+                self.evaluated, ["site"],
+                profile=("profile", "first")).sort_values(
+                        "up_fail", ascending=False)
         return(res)
 
-def build_reporter_from_gestionate(data):
-    """ Rename columns and remove unused ones."""
-
-    clean = pd.DataFrame()
+def downcast(column):
+    """ Smallest numeric type holding every value of "column" exactly.
+    Floats are only downcast if none of them loses precision."""
+
+    if pd.api.types.is_integer_dtype(column):
+        small = pd.to_numeric(column, downcast="integer")
+        return small if small.dtype != column.dtype else column
+    if pd.api.types.is_float_dtype(column) and column.dtype != np.float32:
+        small = column.astype(np.float32)
+        exact = small.to_numpy(dtype=np.float64) == column.to_numpy()
+        if (exact | column.isna().to_numpy()).all():
+            return small
+    return column
+
+def normalize_schema(data):
+    """ Keep repeated strings as categoricals, with sorted categories so
+    they group and sort like strings, and numbers in the smallest type
+    that holds them."""
+
+    columns = {}
+    for column in data.columns:
+        original = values = data[column]
+        if column in CATEGORY_COLUMNS:
+            if not isinstance(values.dtype, pd.CategoricalDtype):
+                values = values.astype("category")
+            elif not values.cat.categories.is_monotonic_increasing:
+                values = values.cat.reorder_categories(
+                        values.cat.categories.sort_values())
+        elif pd.api.types.is_numeric_dtype(values) \
+                and not pd.api.types.is_bool_dtype(values):
+            values = downcast(values)
+        if values is not original:
+            columns[column] = values
+    return data.assign(**columns) if columns else data
+
+def memory_breakdown(data):
+    """ Bytes used by each column of "data", and their total."""
+
+    usage = data.memory_usage(index=True, deep=True)
+    return {
+            "rows": len(data),
+            "bytes": int(usage.sum()),
+            "columns": {
+                    str(column): int(nbytes)
+                    for column, nbytes in usage.items()}}
+
+def rename_gestionate(data):
+    """ Rename columns and remove unused ones. Columns with more than one
+    spelling are merged, whichever of them the export uses."""
+
+    clean = pd.DataFrame(index=data.index)
     for key, value in EXCEL_KEY_MAPPING.items():
-        clean[value] = data[key]
+        if key not in data.columns:
+            continue
+        if value in clean.columns:
+            clean[value] = clean[value].fillna(data[key])
+        else:
+            clean[value] = data[key]
+    return clean
+
+def parse_gestionate(clean):
+    """ Parse the typed columns of renamed gestionate data."""
 
     # Parse timestamp column as datetime. 
     clean["timestamp"] = pd.to_datetime(clean["timestamp"],
             format="%Y-%m-%d %H:%M:%S.%f")
 
     # Remove duplicate tests.
-    clean.drop_duplicates(
-            ['site', 'dn_br', 'up_br', 'timestamp', 'hour'])
+    clean = clean.drop_duplicates(TEST_KEY)
+
+    # Profile id is the download speed, eg: "Bajada:12-Subida:3" -> 12.
+    profile = clean["profile"].str.split("-").str[0]
+    profile = profile.str.split(":").str[1].str.split(".").str[0]
+    clean["profile_id"] = profile.str.strip().astype(int)
+    return clean
+
+def clean_gestionate(data):
+    """ Rename columns, remove unused ones and parse the typed ones."""
+
+    return parse_gestionate(rename_gestionate(data))
 
-    def profile_id(row):
-        profile = row["profile"]
-        profile_id = int(
-                profile.split("-")[0].split(":")[1].split(".")[0].strip())
-        return profile_id
+def build_reporter_from_gestionate(data):
+    """ Build a reporter from a raw gestionate export."""
 
-    clean["profile_id"] = clean.apply(lambda x: profile_id(x), axis=1)
-    reporter = Reporter(clean)
+    reporter = Reporter(normalize_schema(clean_gestionate(data)))
     return reporter 
 
 ########################################################################
 ########################################################################
 ########################################################################
 
-def filter_test_qty_tkt(tests, tickets_tmp, min_test_qty, tkt_test_qty):
+def merge_tickets(tickets, window=None):
+    """ Merge the overlapping and adjacent tickets of each site, so every
+    moment of downtime is counted once. "tickets" has "site", "start" and
+    "end" columns. If "window" (start, end) is given, tickets are clipped
+    to it and the ones outside it are dropped."""
+
+    tickets = tickets.dropna(subset=["start", "end"])
+    if window is not None:
+        tickets = tickets.assign(
+                start=tickets["start"].clip(lower=window[0]),
+                end=tickets["end"].clip(upper=window[1]))
+    tickets = tickets[tickets["end"] > tickets["start"]]
+    tickets = tickets.sort_values(["site", "start"], kind="stable")
+
+    # A ticket starts a new interval if it opens after every previous 
+    # ticket of the site has been resolved.
+    reach = tickets.groupby("site")["end"].cummax()
+    prev_reach = reach.groupby(tickets["site"]).shift()
+    interval = (~(tickets["start"] <= prev_reach)).cumsum()
+
+    merged = tickets.groupby(interval).agg(
+            site=("site", "first"),
+            start=("start", "first"),
+            end=("end", "max"))
+    return merged.reset_index(drop=True)
+
+def ticket_downtime(tickets, window=None):
+    """ Total downtime per site, with overlapping tickets merged."""
+
+    merged = merge_tickets(tickets, window)
+    merged["dn_time"] = merged["end"] - merged["start"]
+
+    # Named aggregation keeps the column when there are no tickets.
+    downtime = merged.groupby("site", as_index=False).agg(
+            dn_time=("dn_time", "sum"))
+    downtime["dn_time"] = downtime["dn_time"].astype("timedelta64[ns]")
+    downtime["dn_time_days"] = downtime["dn_time"].dt.days
+    return downtime
+
+def filter_test_qty_tkt(tests, tickets_tmp, min_test_qty, tkt_test_qty,
+        window=None):
     """ Remove tests from sites with less than "min_test_qty" tests. 
-    In case site has a ticket, use "tkt_test_qty". """
+    In case site has a ticket, use "tkt_test_qty". Downtime can be 
+    clipped to the billing "window" (start, end)."""
 
     # Check interruption size. 
     tickets = pd.DataFrame()
@@ -196,17 +560,13 @@ def filter_test_qty_tkt(tests, tickets_tmp, min_test_qty, tkt_test_qty):
     tickets['end'] = pd.to_datetime(
             tickets_tmp['FECHA_HORA_DE_RESOLUCION'])
     tickets['end'] = tickets['end'].fillna(datetime.today())
-    tickets['dn_time'] = (tickets['end'] - tickets['start'])
-    tickets['dn_time_days'] = tickets['dn_time'].dt.days
 
     # Check total downtime per site.
-    tickets = tickets.groupby(by=['site']).sum()
-    tickets = tickets.reset_index()
+    tickets = ticket_downtime(tickets, window)[["site", "dn_time_days"]]
 
     # Check total test qty per site. 
     test_qty = tests.groupby("site").size().reset_index(name="count")
-    test_qty["site"] = test_qty.apply(
-            lambda row: int(row.site.split("-")[0]), axis=1)
+    test_qty["site"] = site_location(test_qty["site"])
 
     # Put number of tests and total downtime in one table.
     summary = pd.merge(test_qty, tickets, on="site", how="left")
@@ -216,38 +576,26 @@ def filter_test_qty_tkt(tests, tickets_tmp, min_test_qty, tkt_test_qty):
     profiles["site"] = tests["site"]
     profiles["profile"] = tests["profile"]
     profiles = profiles.drop_duplicates(['site', "profile"])
-    profiles["site"] = profiles.apply(
-            lambda row: int(row.site.split("-")[0]), axis=1)
+    profiles["site"] = site_location(profiles["site"])
 
     summary = pd.merge(summary, profiles, on="site", how="left")
 
     # Check valid tests based on contracts logic: a site must have 
-    # 30 or more tests unless it has been out for 24 hrs or more 
-    # (tickets). In that case it should have at least 15 tests.
-    def check_valid_sites(row):
-        if row["count"] < 30:
-            if row["dn_time_days"] >= 1:
-                if row["count"] < 15:
-                    return "> 24 hr & < 15 tests"
-                else:
-                    return "valid"
-            else:
-                return "< 30 tests"
-        else:
-            return "valid"
-                
-    #Apply above function.
-    summary["validity"] = summary.apply(
-            lambda row: check_valid_sites(row), axis=1)
-
-    invalid = summary[summary["validity"] != "valid"]
-
-    tests["clean_loc"] = tests.apply(
-            lambda row: int(row.site.split("-")[0]), axis=1)
-    for site in invalid["site"].unique():
-        tests = tests[tests["clean_loc"] != site]
-
-    print(summary)
+    # "min_test_qty" or more tests unless it has been out for 24 hrs or
+    # more (tickets). In that case it should have at least 
+    # "tkt_test_qty" tests.
+    enough = summary["count"] >= min_test_qty
+    out = summary["dn_time_days"] >= 1
+    summary["validity"] = np.select(
+            [enough, out & (summary["count"] >= tkt_test_qty), out],
+            ["valid", "valid", "> 24 hr & < %d tests" % tkt_test_qty],
+            default="< %d tests" % min_test_qty)
+
+    # Remove tests of invalid sites.
+    invalid = summary.loc[summary["validity"] != "valid", "site"]
+    tests = tests[~site_location(tests["site"]).isin(invalid.unique())]
+
+    logger.debug("Site validity:\n%s", summary)
     return tests, summary
 
 
@@ -269,83 +617,97 @@ def eval_tests(data):
     """ Check if test is passed or failed on dowload, upload and both
     directions. Add columns with this information to data."""
 
-    def eval_func(row, direction):
-        expected = getattr(row, "exp_"+direction+"_br")
-        found = getattr(row, direction+"_br")
-        if expected > found:
-            return False 
-        return True
-
-    # Use eval_func to check tests.
-    data["dn_pass"] = data.apply(
-            lambda row: eval_func(row, "dn"), axis=1)
-    data["up_pass"] = data.apply(
-            lambda row: eval_func(row, "up"), axis=1)
+    data["dn_pass"] = eval_direction(data, "dn")
+    data["up_pass"] = eval_direction(data, "up")
 
     data["pass"] = data.dn_pass & data.up_pass
 
     return data
 
+def nearest_quantile(values, starts, q):
+    """ "nearest" quantile of every run of "values" beginning at "starts".
+    Each run must be sorted ascending with NaNs last. NaNs are ignored,
+    like Series.quantile does, and the rank is rounded the way numpy
+    does."""
+
+    valid = np.add.reduceat((~np.isnan(values)).astype(np.int64), starts)
+    ranks = np.around((valid - 1) * q).astype(np.intp)
+    res = values[starts + np.maximum(ranks, 0)]
+    return np.where(valid > 0, res, np.nan)
+
+def compliance_table(data, q=0.05):
+    """ Evaluate the rules of check_compliance for every profile and hour
+    of the day at once. Tests are grouped by sorting them on a (profile,
+    hour) code, so each group is a contiguous run and every column is
+    computed with one vectorized pass over the runs."""
+
+    # Save expected performance of each profile.
+    expected = data.groupby("profile", sort=False)[
+            ["exp_dn_br", "exp_up_br"]].first()
+
+    # Filter based on test timestamp. Do not use "hour" column. It 
+    # has been found to have invalid info. 
+    hour = data["timestamp"].dt.hour
+    in_hours = ((hour >= 6) & (hour <= 20)).to_numpy()
+    data = data[in_hours]
+    hour = hour.to_numpy()[in_hours]
+
+    # Stable sort keeps the original test order inside each group, so 
+    # averages are summed in the same order as before.
+    profile_codes, profiles = pd.factorize(data["profile"])
+    codes = profile_codes*24 + hour
+    order = np.argsort(codes, kind="stable")
+    starts = np.flatnonzero(np.diff(codes[order], prepend=-1))
+    group_codes = codes[order][starts]
+    count = np.diff(np.append(starts, len(codes)))
+
+    res = {
+            "profile": profiles[group_codes // 24],
+            "hour": group_codes % 24,
+            "count": count}
+    exp = expected.reindex(res["profile"])
+    res["exp_dn_br"] = exp["exp_dn_br"].to_numpy()
+    res["exp_up_br"] = exp["exp_up_br"].to_numpy()
+
+    found = {}
+    for direction in ["dn", "up"]:
+        values = data[direction + "_br"].to_numpy(dtype=float)
+        found[direction] = values[order]
+
+        # This is the 5 % of X for the tests in a given hour.
+        ranked = values[np.lexsort((values, codes))]
+        res[direction + "_nth_value"] = nearest_quantile(ranked, starts, q)
+
+    # One mean per group slice, reduceat would not sum pairwise like 
+    # np.average does.
+    ends = starts + count
+    for direction in ["dn", "up"]:
+        res["avg_" + direction + "_br"] = np.array([
+                found[direction][start:end].mean()
+                for start, end in zip(starts, ends)])
+
+    # Evaluate if 5 % of X is above expected bit rate. 
+    res["dn_pass"] = res["dn_nth_value"] >= res["exp_dn_br"]
+    res["up_pass"] = res["up_nth_value"] >= res["exp_up_br"]
+    res["pass"] = res["dn_pass"] & res["up_pass"]
+
+    # Count passed tests.
+    for direction in ["dn", "up"]:
+        passed = eval_direction(data, direction).to_numpy()[order]
+        res[direction + "_pass_count"] = np.add.reduceat(
+                passed.astype(np.int64), starts)
+    for direction in ["dn", "up"]:
+        res[direction + "_pass_%"] = res[
+                direction + "_pass_count"]*100/count
+
+    return pd.DataFrame(res)
+
 def check_compliance(data):
     """ Evaluate the rules to check service compliance according to 
     contract. Test data must belong to only one profile, else function 
     will perform wrongly."""
 
-    profile_compliance = pd.DataFrame()
-
-    # Save expected performance.
-    exp_dn_br = data["exp_dn_br"].unique()[0]
-    exp_up_br = data["exp_up_br"].unique()[0]
-
-    for hour in range(6,21):
-     
-        # Filter based on test timestamp. Do not use "hour" column. It 
-        # has been found to have invalid info. 
-        hour_data = data[data["timestamp"].dt.hour == hour]
-        if hour_data.empty:
-            continue
-
-        # This is the 5 % of X for the tests in a given hour.
-        dn_nth_value = hour_data["dn_br"].quantile(
-                0.05, interpolation="nearest")
-        up_nth_value = hour_data["up_br"].quantile(
-                0.05, interpolation="nearest")
-
-        # Evaluate if 5 % of X is above expected bit rate. 
-        dn_pass = True if dn_nth_value >= exp_dn_br else False
-        up_pass = True if up_nth_value >= exp_up_br else False
-
-        # Check if tests pass.
-        eval_data = eval_tests(hour_data)
-
-        # Count passed and failed tests.
-        dn_pass_count = len(eval_data[eval_data["dn_pass"] == True])
-        up_pass_count = len(eval_data[eval_data["up_pass"] == True])
-
-        count = len(hour_data)
-
-        hour_compliance = pd.DataFrame({
-                "hour": hour,
-                "count": count,
-                "exp_dn_br": exp_dn_br,
-                "exp_up_br": exp_up_br,
-                "dn_nth_value": dn_nth_value,
-                "up_nth_value": up_nth_value,
-                "avg_dn_br": np.average(hour_data["dn_br"]),
-                "avg_up_br": np.average(hour_data["up_br"]),
-                "dn_pass": dn_pass,
-                "up_pass": up_pass,
-                "pass": dn_pass & up_pass,
-                "dn_pass_count": dn_pass_count,
-                "up_pass_count": up_pass_count,
-                "dn_pass_%": dn_pass_count*100/count,
-                "up_pass_%": up_pass_count*100/count} ,index=[0])
-
-        # Append hour data to profile data.
-        profile_compliance = pd.concat(
-                [profile_compliance, hour_compliance],
-                ignore_index = True, axis=0)
-
+    profile_compliance = compliance_table(data).drop(columns=["profile"])
     return profile_compliance
 
 def profile_summary(data, profile):
@@ -363,24 +725,41 @@ def profile_summary(data, profile):
 
     return summary
 
-def get_compliance_report(tests_data, tickets_data):
-    print("################### asi entra a compliance report")
-    print(tests_data)
+def get_compliance_report(tests_data, tickets_data, report_folder=None,
+        progress=None, min_test_qty=MIN_TEST_QTY,
+        tkt_test_qty=TKT_TEST_QTY):
+    """ Write the compliance workbook and return its path. 
+    "report_folder" defaults to the app REPORT_FOLDER. "progress" is
+    called with the stage name and details as the report advances.
+    Sheets are streamed to disk as they are written."""
+
+    if report_folder is None:
+        report_folder = current_app.config["REPORT_FOLDER"]
+    if progress is None:
+        progress = lambda stage, **info: None
+
+    logger.debug("Compliance report tests:\n%s", tests_data)
+    progress("tickets")
     valid_tests, site_validity = filter_test_qty_tkt(
-            tests_data, tickets_data, 30, 15)
+            tests_data, tickets_data, min_test_qty, tkt_test_qty)
 
-    print("################# esto es despues de filtrar los tickets")
-    print(valid_tests)
+    logger.debug("Tests after filtering tickets:\n%s", valid_tests)
     summary = pd.DataFrame()
 
     timestamp = datetime.strftime(datetime.now(), "%d%m%y_%H%M%S")
     filename = secure_filename("Compliance_" + timestamp + ".xlsx")
-    path =  os.path.join(current_app.config["REPORT_FOLDER"], filename)
+    path =  os.path.join(report_folder, filename)
+
+    # Check compliance of every profile and hour with all sites.
+    compliance = compliance_table(valid_tests)
 
-    with pd.ExcelWriter(path) as writer:
+    with StreamWriter(path) as writer:
 
-        site_validity.to_excel(writer, sheet_name="Valid Sites")
-        for profile in valid_tests["profile"].unique():
+        writer.write_frame(site_validity, "Valid Sites")
+        profiles = valid_tests["profile"].unique()
+        for i, profile in enumerate(profiles):
+            progress("compliance", profile=profile, done=i,
+                    total=len(profiles))
 
             # Build sheet name prefix with download and upload speed 
             # information. Eg: 12X3
@@ -390,30 +769,23 @@ def get_compliance_report(tests_data, tickets_data):
             sheet_name_prefix += "X"
             sheet_name_prefix += profile.split("-")[1].split(":")[1]
 
-            # Get profile tests.
-            profile_data = filter_and_count(
-                    valid_tests, param="profile",value=profile)
-            print("################ este es el perfil")
-            print(profile)
-            print("estos son los tests")
-            print(profile_data)
-
-            # Check compliance with all sites.
-            compliance_data = check_compliance(profile_data)
-            print("########## esto es el compliance data de ese perfil")
-            print(compliance_data)
+            # Get profile compliance.
+            compliance_data = compliance[compliance["profile"] == profile]
+            compliance_data = compliance_data.drop(
+                    columns=["profile"]).reset_index(drop=True)
+            logger.debug("Compliance of profile %s:\n%s",
+                    profile, compliance_data)
             sheet_name = sheet_name_prefix + " Compliance"
-            compliance_data.to_excel(writer, sheet_name=sheet_name)
+            writer.write_frame(compliance_data, sheet_name)
 
             # Calculate summary all sites.
             profile_summary_data = profile_summary(
                     compliance_data, profile)
             summary = pd.concat([summary, profile_summary_data],
                     ignore_index = True, axis=0)
-            print("############# esto es el summary")
-            print(summary)
+            logger.debug("Payment summary:\n%s", summary)
 
-        summary.to_excel(writer, sheet_name="Payment Summary")
-        print("################### este es el path")
-        print(path)
+        writer.write_frame(summary, "Payment Summary")
+        progress("write")
+        logger.info("Compliance report written to %s", path)
         return path
@@ -1,19 +1,30 @@
 from datetime import datetime
 from werkzeug.utils import secure_filename
 import pandas as pd
-import urllib.parse
 import os
 
 from app.main import bp
 from flask import render_template, url_for, session, flash, redirect
-from flask import session, current_app, send_file
+from flask import session, current_app, send_file, jsonify, abort, request
 from flask_login import login_required, current_user
 from app.main.forms import DataForm, FilterForm, ComplianceForm
-from app.main.reporter import build_reporter_from_gestionate
-from app.main.reporter import get_compliance_report
-from app.main.grapher import Grapher
+from app.main.forms import LocationsForm
+from app.main.store import save_dataset, append_dataset
+from app.main.ingest import read_gestionate_files
+from app.main.cache import get_reporter, reporter_cache
+from app.main.shared import publish_dataset
+from app.main.jobs import submit_compliance_job, read_job
+from app.main.grapher import render_charts, render_stats, wait_chart
+from app.main.downsample import throughput_series
+from app.main.tables import TABLES, get_table, table_page
+from app.main.locations import locations, read_locations
+from app.main.filtering import normalize_filters
+from app.main.timing import stage, metrics
 from app import db
 
+# Sites a single summary request can ask for.
+MAX_SUMMARY_SITES = 1000
+
 @bp.route('/', methods=['POST','GET'])
 @bp.route('/index', methods=['POST','GET'])
 @login_required
@@ -21,35 +32,34 @@ def index():
 
     if "data_pkl_path" in session.keys():
 
-        test_data = pd.read_pickle(session["data_pkl_path"])
-        sites = pd.read_pickle("data_sets/locations.pkl")
-
-        reporter = build_reporter_from_gestionate(test_data)
-        reporter.filter_sites(sites)
-        reporter.eval_tests()
+        reporter = get_reporter(
+                session["data_pkl_path"], session.get("filters"))
 
-        if "filters" in session.keys():
-            reporter.apply_filters(session["filters"])
+        with stage("summary"):
+            summary = reporter.get_summary()
+            failed_prog = reporter.get_failed_by_day_hr()
 
-        summary = reporter.get_summary()
+        with stage("chart_data"):
+            plt_data_dn = pd.DataFrame()
+            plt_data_dn["x"] = reporter.evaluated["timestamp"]
+            plt_data_dn["y"] = reporter.evaluated["dn_br"]
+            plt_data_dn["pass"] = reporter.evaluated["dn_pass"]
 
-        failed_prog = reporter.get_failed_by_day_hr()
-        Grapher.progress_stacked_area(failed_prog, "failed.png")
-        
-        plt_data_dn = pd.DataFrame()
-        plt_data_dn["x"] = reporter.evaluated["timestamp"]
-        plt_data_dn["y"] = reporter.evaluated["dn_br"]
-        plt_data_dn["pass"] = reporter.evaluated["dn_pass"]
-        Grapher.progress_scatter(plt_data_dn, "dn_br.png", 0.75)
+            plt_data_up = pd.DataFrame()
+            plt_data_up["x"] = reporter.evaluated["timestamp"]
+            plt_data_up["y"] = reporter.evaluated["up_br"]
+            plt_data_up["pass"] = reporter.evaluated["up_pass"]
 
-        plt_data_up = pd.DataFrame()
-        plt_data_up["x"] = reporter.evaluated["timestamp"]
-        plt_data_up["y"] = reporter.evaluated["up_br"]
-        plt_data_up["pass"] = reporter.evaluated["up_pass"]
-        Grapher.progress_scatter(plt_data_up, "up_br.png", 0.75)
+        # Render the three charts in parallel, the page does not wait.
+        charts = dict(zip(["failed", "dn_br", "up_br"], render_charts([
+                ("progress_stacked_area", failed_prog, {}),
+                ("progress_scatter", plt_data_dn, {"dot_size": 0.75}),
+                ("progress_scatter", plt_data_up, {"dot_size": 0.75})])))
 
-        return render_template(
-                'index.html', title='Home', summary=summary)
+        with stage("template"):
+            return render_template(
+                    'index.html', title='Home', summary=summary,
+                    charts=charts)
 
     return render_template('index.html', title='Home')
 
@@ -58,10 +68,28 @@ def index():
 def filters():
     form = FilterForm()
     if form.validate_on_submit():
-        session["filters"] = {}
-        session["filters"].update({"profile_id": form.profile.data})
-        session["filters"].update({"type": form.test_type.data})
+        # Sites may be separated by commas, spaces or new lines.
+        sites = (form.sites.data or "").replace(",", " ").split()
+        session["filters"] = normalize_filters({
+                "profile_id": form.profile.data,
+                "type": form.test_type.data,
+                "site": sites,
+                "start": form.start.data,
+                "end": form.end.data})
         return redirect(url_for("main.index"))
+
+    # Show the filters in use.
+    if request.method == "GET":
+        current = normalize_filters(session.get("filters"))
+        form.profile.data = current.get("profile_id", [])
+        form.test_type.data = current.get("type", [])
+        form.sites.data = ", ".join(current.get("site", []))
+        if "start" in current:
+            form.start.data = datetime.strptime(
+                    current["start"], "%Y-%m-%d").date()
+        if "end" in current:
+            form.end.data = datetime.strptime(
+                    current["end"], "%Y-%m-%d").date()
     return render_template(
             'filters.html', title='Filters', form=form)
 
@@ -79,53 +107,76 @@ def data_loader():
         form.op_file.data.save("uploads/" + op_filename)
         form.non_op_file.data.save("uploads/" + non_op_filename)
 
-        op_data = pd.read_excel(
-                "uploads/" + op_filename, sheet_name = "ReportSheet",
-                header=1, parse_dates=True)
-        non_op_data = pd.read_excel(
-                "uploads/" + non_op_filename, sheet_name = "ReportSheet",
-                header=1, parse_dates=True)
+        with stage("ingest"):
+            test_data, stats = read_gestionate_files([
+                    "uploads/" + op_filename,
+                    "uploads/" + non_op_filename])
+        flash("{} tests parsed in {:.1f} s ({:.0f} rows/s).".format(
+                stats["rows"], stats["seconds"], stats["rows_per_s"]))
+
+        # Older datasets are single files and can not be appended to.
+        current = session.get("data_pkl_path")
+        with stage("store"):
+            if form.append.data and current and os.path.isdir(current):
+                data_path = current
+                merge = append_dataset(test_data, data_path)
+            else:
+                data_path = "data_sets/" + timestamp
+                merge = save_dataset(test_data, data_path)
+
+        # Workers attach the published copy instead of loading their own.
+        with stage("publish"):
+            publish_dataset(data_path)
+        flash("{} tests added, {} duplicates skipped.".format(
+                merge["added"], merge["duplicates"] + stats["duplicates"]))
+
+        # Reporters of the replaced dataset will not be used again.
+        if current:
+            reporter_cache.invalidate(current)
+        session["data_pkl_path"] = data_path
 
-        test_data = pd.concat([op_data, non_op_data],
-                ignore_index = True, axis=0)
-        test_data.reset_index()
+        return redirect(url_for('main.index'))
+
+    return render_template(
+            'data_loader.html', title='Data Loader', form=form)
 
-        pkl_path = "data_sets/" + timestamp + ".pkl"
-        test_data.to_pickle(pkl_path)
-        session["data_pkl_path"] =  pkl_path
+@bp.route('/locations', methods=['POST','GET'])
+@login_required
+def locations_loader():
+    form = LocationsForm()
+    if form.validate_on_submit():
 
+        timestamp = datetime.strftime(datetime.now(), "%d%m%y_%H%M%S")
+        filename = secure_filename("locations_" + timestamp + ".xlsx")
+        form.locations_file.data.save("uploads/" + filename)
+
+        try:
+            ids = read_locations("uploads/" + filename)
+        except ValueError as e:
+            flash(str(e))
+            return redirect(url_for('main.locations_loader'))
+
+        # Cached reporters notice the new file and are rebuilt.
+        locations.replace(ids)
+        flash("{} locations loaded.".format(len(locations.get()[0])))
         return redirect(url_for('main.index'))
 
+    ids, version = locations.get()
     return render_template(
-            'data_loader.html', title='Data Loader', form=form)
+            'locations.html', title='Locations', form=form,
+            count=len(ids),
+            updated=datetime.fromtimestamp(version / 1e9).strftime(
+                    "%Y-%m-%d %H:%M:%S"))
 
 @bp.route('/progress', methods=["GET"])
 @login_required
 def progress():
     if "data_pkl_path" in session.keys():
 
-        # Load data.
-        test_data = pd.read_pickle(session["data_pkl_path"])
-        sites = pd.read_pickle("data_sets/locations.pkl")
-
-        # Init reporter.
-        reporter = build_reporter_from_gestionate(test_data)
-        reporter.filter_sites(sites)
-        reporter.eval_tests()
-        if "filters" in session.keys():
-            reporter.apply_filters(session["filters"])
-
-        # Get relevant data.
-        progress = reporter.get_progress()
-
-        # Add links.
-        url = url_for("main.day")
-        link = '<a href="'+url+'/{0}">{0}</a>'
-        progress["timestamp"] = progress["timestamp"].dt.date.apply(
-                lambda x: link.format(urllib.parse.quote_plus(
-                        x.strftime("%Y-%m-%d"))))
+        # Rows are fetched page by page from the table API.
         return render_template(
-                "table.html", title="Progress", data=progress)
+                "table.html", title="Progress", table="progress",
+                link_column="timestamp", link_url=url_for("main.day"))
     return redirect(url_for("main.index"))
 
 @bp.route("/compliance", methods=["GET", "POST"])
@@ -146,39 +197,8 @@ def compliance():
         form.non_op_file.data.save("uploads/" + non_op_filename)
         form.tickets_file.data.save("uploads/" + tickets_filename)
 
-        op_data = pd.read_excel(
-                "uploads/" + op_filename, sheet_name=0,
-                header=1, parse_dates=True)
-        non_op_data = pd.read_excel(
-                "uploads/" + non_op_filename, sheet_name=0,
-                header=1, parse_dates=True)
-        tickets_data = pd.read_excel(
-                "uploads/" + tickets_filename , sheet_name=0,
-                header=0, parse_dates=True)
-
-        test_data = pd.concat([op_data, non_op_data],
-                ignore_index = True, axis=0)
-        test_data.reset_index()
-
-        pkl_path = "data_sets/" + timestamp + ".pkl"
-        test_data.to_pickle(pkl_path)
-        sites = pd.read_pickle("data_sets/locations.pkl")
-        reporter = build_reporter_from_gestionate(test_data)
-        reporter.filter_sites(sites)
-        print("################## esto es despues de filtrar locations")
-        print(reporter.filtered)
-
-        filtered_data = reporter.filtered[
-                reporter.filtered["res"]=="succeeded"]
-        print("################## esto es despues de filtrar succeeded")
-        print(filtered_data)
-
-        remove_list = form.remove_vsats.data.split(",")
-        for item in remove_list:
-            filtered_data = filtered_data[
-                filtered_data["site"] != item.strip()]
-        print("################## esto es despues de filtrar rmv ids")
-        print(filtered_data)
+        remove_ids = [
+                item.strip() for item in form.remove_vsats.data.split(",")]
 
         type_filter = []
         if form.scheduled.data:
@@ -188,99 +208,243 @@ def compliance():
         if form.monitoring.data:
             type_filter.append("monitoring")
 
-        filtered_data = filtered_data[
-                filtered_data["type"].isin(type_filter)]
-        print("########## esto es despues de filtrar type")
-        print(filtered_data)
+        # Parsing and the report run in a worker process.
+        job_id = submit_compliance_job(
+                current_app.config["JOB_FOLDER"],
+                current_app.config["JOB_WORKERS"],
+                op_path="uploads/" + op_filename,
+                non_op_path="uploads/" + non_op_filename,
+                tickets_path="uploads/" + tickets_filename,
+                remove_ids=remove_ids,
+                types=type_filter,
+                report_folder=current_app.config["REPORT_FOLDER"])
+        session["compliance_job"] = job_id
 
-        cmpl_file_path = get_compliance_report(filtered_data, tickets_data)
+        return redirect(url_for("main.compliance_job", job_id=job_id))
 
-        return send_file(cmpl_file_path, as_attachment=True)
-        #return redirect(url_for("main.index"))
+    return render_template(
+            "compliance.html", title="Compliance", form=form,
+            job_id=session.get("compliance_job"))
 
+@bp.route("/compliance/<job_id>", methods=["GET"])
+@login_required
+def compliance_job(job_id):
+    try:
+        job = read_job(current_app.config["JOB_FOLDER"], job_id)
+    except KeyError:
+        abort(404)
     return render_template(
-            "compliance.html", title="Compliance", form=form)
+            "compliance_job.html", title="Compliance", job=job)
+
+@bp.route("/compliance/<job_id>/status", methods=["GET"])
+@login_required
+def compliance_job_status(job_id):
+    try:
+        job = read_job(current_app.config["JOB_FOLDER"], job_id)
+    except KeyError:
+        abort(404)
+    job.pop("traceback", None)
+    return jsonify(job)
+
+@bp.route("/compliance/<job_id>/download", methods=["GET"])
+@login_required
+def compliance_job_download(job_id):
+    try:
+        job = read_job(current_app.config["JOB_FOLDER"], job_id)
+    except KeyError:
+        abort(404)
+    if job["status"] != "done":
+        return redirect(url_for("main.compliance_job", job_id=job_id))
+    path = os.path.join(current_app.config["REPORT_FOLDER"], job["file"])
+    try:
+        return send_file(path, as_attachment=True)
+    except FileNotFoundError:
+        # Evicted from the report cache since the job ran.
+        flash("The report has expired, please run it again.")
+        return redirect(url_for("main.compliance"))
 
 @bp.route('/vsat', methods=["GET"])
 @bp.route('/vsat/<vsat_id>', methods=["GET"])
 @login_required
 def vsat(vsat_id=None):
     if "data_pkl_path" in session.keys():
-            
-        # Load data.
-        test_data = pd.read_pickle(session["data_pkl_path"])
-        sites = pd.read_pickle("data_sets/locations.pkl")
-
-        # Init reporter.
-        reporter = build_reporter_from_gestionate(test_data)
-        reporter.filter_sites(sites)
-        reporter.eval_tests()
-        if "filters" in session.keys():
-            reporter.apply_filters(session["filters"])
 
         if vsat_id:
-            data = reporter.evaluated[
-                    reporter.evaluated["site"]==vsat_id]
+            # Load evaluated and filtered data.
+            reporter = get_reporter(
+                    session["data_pkl_path"], session.get("filters"))
+            with stage("select"):
+                data = reporter.get_site(vsat_id)
 
             plt_data_dn = pd.DataFrame()
             plt_data_dn["x"] = data["timestamp"]
             plt_data_dn["y"] = data["dn_br"]
             plt_data_dn["pass"] = data["dn_pass"]
-            Grapher.progress_scatter(plt_data_dn, "vsat_dn_br.png",
-                    dot_size=12)
 
             plt_data_up = pd.DataFrame()
             plt_data_up["x"] = data["timestamp"]
             plt_data_up["y"] = data["up_br"]
             plt_data_up["pass"] = data["up_pass"]
-            Grapher.progress_scatter(plt_data_up, "vsat_up_br.png",
-                    dot_size=12)
-            return render_template("vsat_graph.html")
-
-        vsats = reporter.get_vsats()
 
-        url = url_for("main.vsat")
-        link = '<a href="'+url+'/{0}">{0}</a>'
-        vsats["site"] = vsats["site"].apply(
-                lambda x: link.format(urllib.parse.quote_plus(x)))
+            charts = dict(zip(["dn_br", "up_br"], render_charts([
+                    ("progress_scatter", plt_data_dn, {"dot_size": 12}),
+                    ("progress_scatter", plt_data_up, {"dot_size": 12})])))
+            return render_template("vsat_graph.html", charts=charts)
 
         return render_template(
-                "table.html", title="VSAT", data=vsats)
+                "table.html", title="VSAT", table="vsat",
+                link_column="site", link_url=url_for("main.vsat"))
     return redirect(url_for("main.index"))
 
+@bp.route('/vsats/summary', methods=["GET", "POST"])
+@login_required
+def vsat_summaries():
+    """ Summaries of several VSATs in one call. Sites are given as a
+    comma separated "sites" argument or a JSON body {"sites": [...]}."""
+
+    if "data_pkl_path" not in session.keys():
+        abort(404)
+    body = request.get_json(silent=True) or {}
+    sites = body.get("sites")
+    if sites is None:
+        sites = request.args.get("sites", "").split(",")
+    sites = [str(site).strip() for site in sites if str(site).strip()]
+    if len(sites) > MAX_SUMMARY_SITES:
+        abort(400)
+
+    reporter = get_reporter(
+            session["data_pkl_path"], session.get("filters"))
+    with stage("summaries"):
+        summaries = reporter.get_site_summaries(sites)
+    return jsonify(summaries)
+
+@bp.route('/table/<name>', methods=["GET"])
+@login_required
+def table(name):
+    """ One page of a table, sorted and searched as the request
+    arguments say."""
+
+    if name not in TABLES or "data_pkl_path" not in session.keys():
+        abort(404)
+    reporter = get_reporter(
+            session["data_pkl_path"], session.get("filters"))
+    with stage("table"):
+        page = table_page(
+                get_table(reporter, name),
+                page=request.args.get("page", 1, type=int),
+                per_page=request.args.get("per_page", 50, type=int),
+                sort=request.args.get("sort"),
+                order=request.args.get("order", "asc"),
+                search=request.args.get("search"))
+    return jsonify(page)
+
 @bp.route('/day', methods=["GET"])
 @bp.route('/day/<date>', methods=["GET"])
 @login_required
 def day(date):
     if "data_pkl_path" in session.keys():
-        # Load data.
-        test_data = pd.read_pickle(session["data_pkl_path"])
-        sites = pd.read_pickle("data_sets/locations.pkl")
-
-        # Init reporter.
-        reporter = build_reporter_from_gestionate(test_data)
-        reporter.filter_sites(sites)
-        reporter.eval_tests()
-        if "filters" in session.keys():
-            reporter.apply_filters(session["filters"])
-        
+        # Load evaluated and filtered data.
+        reporter = get_reporter(
+                session["data_pkl_path"], session.get("filters"))
+
         selected_date = datetime.strptime(date, "%Y-%m-%d")
-        data = reporter.evaluated[
-                reporter.evaluated[
-                        "timestamp"].dt.date==selected_date.date()]
+        with stage("select"):
+            data = reporter.get_day(selected_date)
 
         plt_data_dn = pd.DataFrame()
         plt_data_dn["x"] = data["timestamp"]
         plt_data_dn["y"] = data["dn_br"]
         plt_data_dn["pass"] = data["dn_pass"]
-        Grapher.progress_scatter(plt_data_dn, "day_dn_br.png")
 
         plt_data_up = pd.DataFrame()
         plt_data_up["x"] = data["timestamp"]
         plt_data_up["y"] = data["up_br"]
         plt_data_up["pass"] = data["up_pass"]
-        Grapher.progress_scatter(plt_data_up, "day_up_br.png")
-        return render_template("day_graph.html")
+
+        charts = dict(zip(["dn_br", "up_br"], render_charts([
+                ("progress_scatter", plt_data_dn, {}),
+                ("progress_scatter", plt_data_up, {})])))
+        return render_template("day_graph.html", charts=charts)
 
     return redirect(url_for("main.index"))
 
+@bp.route('/cache_stats', methods=["GET"])
+@login_required
+def cache_stats():
+    return jsonify(reporter_cache.stats())
+
+@bp.route('/metrics', methods=["GET"])
+@login_required
+def request_metrics():
+    """ Latency histograms of requests and their stages, and rows of the
+    cached datasets."""
+
+    res = metrics.to_dict()
+    res["datasets"] = reporter_cache.rows()
+    res["reporter_cache"] = reporter_cache.stats()
+    return jsonify(res)
+
+@bp.route('/memory_stats', methods=["GET"])
+@login_required
+def memory_stats():
+    """ Memory used by each column of every cached dataset."""
+
+    return jsonify(reporter_cache.memory())
+
+@bp.route('/charts/<name>', methods=["GET"])
+@login_required
+def chart(name):
+    """ A rendered chart, once its render is done."""
+
+    path = wait_chart(name)
+    if path is None:
+        abort(404)
+    return send_file(path, mimetype="image/png")
+
+@bp.route('/render_stats', methods=["GET"])
+@login_required
+def chart_render_stats():
+    """ Render time and memory of the last rendered charts."""
+
+    return jsonify(list(render_stats))
+
+def chart_data(data):
+    """ Reply with the throughput series of "data" for the viewport and
+    direction in the request arguments."""
+
+    direction = request.args.get("direction", "dn")
+    if direction not in ["dn", "up"]:
+        abort(400)
+    return jsonify(throughput_series(
+            data, direction,
+            start=request.args.get("start", type=int),
+            end=request.args.get("end", type=int),
+            width=request.args.get("width", 1000, type=int)))
+
+@bp.route('/index/data', methods=["GET"])
+@login_required
+def index_data():
+    if "data_pkl_path" not in session.keys():
+        abort(404)
+    reporter = get_reporter(
+            session["data_pkl_path"], session.get("filters"))
+    return chart_data(reporter.evaluated)
+
+@bp.route('/day/<date>/data', methods=["GET"])
+@login_required
+def day_data(date):
+    if "data_pkl_path" not in session.keys():
+        abort(404)
+    reporter = get_reporter(
+            session["data_pkl_path"], session.get("filters"))
+    selected_date = datetime.strptime(date, "%Y-%m-%d")
+    return chart_data(reporter.get_day(selected_date))
+
+@bp.route('/vsat/<vsat_id>/data', methods=["GET"])
+@login_required
+def vsat_data(vsat_id):
+    if "data_pkl_path" not in session.keys():
+        abort(404)
+    reporter = get_reporter(
+            session["data_pkl_path"], session.get("filters"))
+    return chart_data(reporter.get_site(vsat_id))
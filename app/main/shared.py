@@ -0,0 +1,122 @@
+import fcntl
+import glob
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import pyarrow as pa
+
+from app.main.diskcache import evict_lru, remove
+from app.main.reporter import normalize_schema
+from app.main.store import load_dataset, dataset_version
+from config import Config
+
+# Datasets a process keeps attached.
+MAX_ATTACHED = 8
+
+def shared_prefix(data_path, folder):
+    """ Path of the published versions of a dataset, without version."""
+
+    digest = hashlib.sha1(os.path.abspath(data_path).encode()).hexdigest()
+    return os.path.join(folder, digest[:16])
+
+def shared_path(data_path, folder):
+    return "{}-{}.arrow".format(
+            shared_prefix(data_path, folder), dataset_version(data_path))
+
+def to_arrow(data):
+    """ Arrow table of a normalized frame laid out so that reading it
+    back into pandas does not copy: one chunk per column and floats with
+    NaN values instead of nulls. Categoricals become dictionaries."""
+
+    arrays = []
+    for name in data.columns:
+        column = data[name]
+        if column.dtype.kind == "f":
+            arrays.append(pa.array(column.to_numpy(), from_pandas=False))
+        else:
+            arrays.append(pa.array(column))
+    return pa.Table.from_arrays(arrays, names=list(data.columns))
+
+def publish_dataset(data_path, folder=None):
+    """ Write the normalized tests of a stored dataset as an Arrow IPC
+    file in the shared folder, a tmpfs by default, unless the current
+    version is there already. Return its path. A lock file makes
+    concurrent workers publish it once."""
+
+    folder = folder or Config.SHARED_FOLDER
+    path = shared_path(data_path, folder)
+    if os.path.exists(path):
+        return path
+
+    os.makedirs(folder, exist_ok=True)
+    prefix = shared_prefix(data_path, folder)
+    with open(prefix + ".lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if os.path.exists(path):
+            return path
+
+        table = to_arrow(normalize_schema(load_dataset(data_path)))
+        with pa.OSFile(path + ".tmp", "wb") as f:
+            with pa.ipc.new_file(f, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(path + ".tmp", path)
+
+        # Workers still mapping an older version keep it until they let
+        # it go.
+        for old in glob.glob(prefix + "-*.arrow"):
+            if old != path:
+                remove(old)
+
+    evict_lru(
+            folder, Config.SHARED_BYTES,
+            lambda entry: entry.name.endswith(".arrow"), keep=path)
+    return path
+
+def attach(path):
+    """ Frame of a published dataset, memory mapped read only. Columns
+    without missing values share the pages of the file."""
+
+    source = pa.memory_map(path, "r")
+    table = pa.ipc.open_file(source).read_all()
+
+    # The file time tells which datasets were attached last.
+    os.utime(path)
+    return table.to_pandas(split_blocks=True)
+
+class SharedDatasets:
+    """ Frames of the published datasets attached by this process, the
+    latest version of each, so every worker maps the same file instead
+    of loading its own copy."""
+
+    def __init__(self, max_entries=MAX_ATTACHED):
+        self.max_entries = max_entries
+        self.frames = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, data_path):
+        """ Return the tests of the stored dataset at "data_path", the
+        path kept in the session, publishing them first if needed."""
+
+        path = publish_dataset(data_path)
+        with self.lock:
+            entry = self.frames.get(data_path)
+            if entry is not None and entry[0] == path:
+                self.frames.move_to_end(data_path)
+                return entry[1]
+
+        try:
+            data = attach(path)
+        except FileNotFoundError:
+            # Evicted by another worker in the meantime.
+            path = publish_dataset(data_path)
+            data = attach(path)
+        with self.lock:
+            self.frames[data_path] = (path, data)
+            self.frames.move_to_end(data_path)
+            while len(self.frames) > self.max_entries:
+                self.frames.popitem(last=False)
+        return data
+
+shared_datasets = SharedDatasets()
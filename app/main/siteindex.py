@@ -0,0 +1,30 @@
+import numpy as np
+import pandas as pd
+
+class SiteIndex:
+    """ Row positions of every site of a frame, grouped once by sorting
+    the site codes, so the tests of a site are found in O(tests of that
+    site) instead of comparing every row. Positions of a site are in row
+    order."""
+
+    def __init__(self, sites):
+        if isinstance(sites.dtype, pd.CategoricalDtype):
+            codes = sites.cat.codes.to_numpy()
+            self.sites = sites.cat.categories
+        else:
+            codes, uniques = pd.factorize(sites)
+            self.sites = pd.Index(uniques)
+
+        # Stable, so each run keeps the row order. Missing sites, code
+        # -1, sort first and are left out.
+        self.order = np.argsort(codes, kind="stable")
+        self.offsets = np.searchsorted(
+                codes[self.order], np.arange(len(self.sites) + 1))
+
+    def positions(self, site):
+        """ Row positions of the tests of "site", empty if it has none."""
+
+        i = self.sites.get_indexer([site])[0]
+        if i < 0:
+            return self.order[:0]
+        return self.order[self.offsets[i]:self.offsets[i + 1]]
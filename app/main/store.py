@@ -0,0 +1,172 @@
+import glob
+import os
+import uuid
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from app.main.reporter import clean_gestionate, rollup_tests, TEST_KEY
+from app.main.reporter import CATEGORY_COLUMNS
+
+# Rows per row group of the stored parts. Tests are stored sorted by
+# timestamp, so loaded datasets need no sorting to be indexed by time.
+ROW_GROUP_SIZE = 50000
+
+# Types of the stored columns, so parts written by different uploads 
+# can be read as a single table.
+COLUMN_TYPES = {
+        "site": pa.string(),
+        "exp_dn_br": pa.float64(),
+        "dn_br": pa.float64(),
+        "exp_up_br": pa.float64(),
+        "up_br": pa.float64(),
+        "res": pa.string(),
+        "timestamp": pa.timestamp("ns"),
+        "profile": pa.string(),
+        "type": pa.string(),
+        "error": pa.string(),
+        "profile_id": pa.int64()}
+
+def test_keys(clean):
+    """ 64 bit hash of the columns identifying each test."""
+
+    key = clean[TEST_KEY].astype({"dn_br": float, "up_br": float})
+    return pd.util.hash_pandas_object(key, index=False).to_numpy()
+
+def dataset_parts(path):
+    return sorted(glob.glob(os.path.join(path, "part-*.parquet")))
+
+def save_dataset(clean, path):
+    """ Create a dataset directory with cleaned gestionate tests. Return
+    the merge summary of append_dataset."""
+
+    os.makedirs(path)
+    return append_dataset(clean, path)
+
+def append_dataset(clean, path):
+    """ Add cleaned tests to a dataset as a new part, skipping the ones 
+    it already holds. Each part keeps the sorted hashes of its tests,
+    memory mapped on lookup, so an append only costs a search per new
+    test. Return the number of tests added and duplicates skipped."""
+
+    parts = dataset_parts(path)
+    keys = test_keys(clean)
+
+    # Skip tests repeated in the new data or already in the dataset.
+    new = ~pd.Series(keys).duplicated().to_numpy()
+    for part in parts:
+        known = part_keys(part)
+        pos = np.searchsorted(known, keys)
+        found = pos < len(known)
+        found[found] = known[pos[found]] == keys[found]
+        new &= ~found
+
+    summary = {"added": int(new.sum()), "duplicates": int((~new).sum())}
+    if not summary["added"]:
+        return summary
+
+    clean = clean[new].sort_values("timestamp", kind="stable")
+    table = pa.Table.from_pandas(clean, preserve_index=False)
+    if parts:
+        schema = pq.read_schema(parts[0])
+    else:
+        schema = pa.schema([
+                (field.name, COLUMN_TYPES.get(field.name, field.type))
+                for field in table.schema])
+    table = table.cast(schema)
+
+    # The part is written under a name the dataset reader ignores and
+    # moved in place once complete, so readers never see it half
+    # written. Its keys follow: a crash in between leaves a part without
+    # keys, which part_keys rebuilds, never keys without a part.
+    part = os.path.join(path, "part-{:05d}.parquet".format(len(parts)))
+    tmp_part = tmp_path(os.path.join(path, "_" + os.path.basename(part)))
+    pq.write_table(table, tmp_part, row_group_size=ROW_GROUP_SIZE)
+    os.replace(tmp_part, part)
+    write_keys(np.sort(keys[new]), part_keys_path(part))
+    write_rollup(table.to_pandas(), part_rollup_path(part))
+    return summary
+
+def tmp_path(path):
+    """ Temporary name to write "path" under, unique to the writer: a
+    reader rebuilding keys or a rollup may write the same file as the
+    appender."""
+
+    return "{}.{}.{}.tmp".format(path, os.getpid(), uuid.uuid4().hex)
+
+def part_keys_path(part):
+    # Files starting with "_" are ignored when reading the dataset.
+    folder, name = os.path.split(part)
+    return os.path.join(folder, "_" + name.replace(".parquet", ".keys.npy"))
+
+def part_keys(part):
+    """ Sorted test hashes of a part, memory mapped. Keys missing, eg:
+    after a crash while appending, are rebuilt from the part."""
+
+    keys_path = part_keys_path(part)
+    if not os.path.exists(keys_path):
+        keys = test_keys(pq.read_table(part).to_pandas())
+        write_keys(np.sort(keys), keys_path)
+    return np.load(keys_path, mmap_mode="r")
+
+def write_keys(keys, path):
+    """ Save the sorted test hashes of a part."""
+
+    tmp = tmp_path(path)
+    with open(tmp, "wb") as f:
+        np.save(f, keys)
+    os.replace(tmp, path)
+
+def part_rollup_path(part):
+    folder, name = os.path.split(part)
+    return os.path.join(
+            folder, "_" + name.replace(".parquet", ".rollup.parquet"))
+
+def write_rollup(clean, path):
+    """ Save the rollup cube of the tests of a part."""
+
+    tmp = tmp_path(path)
+    rollup_tests(clean).to_parquet(tmp, index=False)
+    os.replace(tmp, path)
+
+def load_rollup(path):
+    """ Return the rollup cube of a dataset, with test positions counted
+    from its first part. Parts written before rollups existed are rolled
+    up once here. Pickled datasets have no cube, None is returned."""
+
+    if path.endswith(".pkl"):
+        return None
+
+    cubes = []
+    offset = 0
+    for part in dataset_parts(path):
+        rollup_path = part_rollup_path(part)
+        if not os.path.exists(rollup_path):
+            write_rollup(pq.read_table(part).to_pandas(), rollup_path)
+        cube = pd.read_parquet(rollup_path)
+        cube["position"] += offset
+        offset += pq.read_metadata(part).num_rows
+        cubes.append(cube)
+    if not cubes:
+        return None
+    return pd.concat(cubes, ignore_index=True)
+
+def dataset_version(path):
+    """ Changes whenever tests are added to the dataset."""
+
+    return os.stat(path).st_mtime_ns
+
+def load_dataset(path):
+    """ Read a stored dataset. Files are memory mapped and the string
+    columns listed in CATEGORY_COLUMNS are decoded straight into
+    categoricals."""
+
+    # Datasets uploaded before the parquet store are raw pickles.
+    if path.endswith(".pkl"):
+        return clean_gestionate(pd.read_pickle(path))
+
+    table = pq.read_table(
+            path, memory_map=True, read_dictionary=CATEGORY_COLUMNS)
+    return table.to_pandas()
@@ -0,0 +1,69 @@
+import math
+import weakref
+
+import pandas as pd
+
+# Largest page a client can ask for.
+MAX_PER_PAGE = 500
+
+# Tables served page by page, built from an evaluated reporter.
+TABLES = {
+        "vsat": lambda reporter: reporter.get_vsats(),
+        "progress": lambda reporter: reporter.get_progress()}
+
+# Tables already built, dropped with the reporter they come from.
+_tables = weakref.WeakKeyDictionary()
+
+def get_table(reporter, name):
+    """ Return the full table "name" of a reporter, building it only
+    once per reporter. The result is shared, callers must not modify
+    it."""
+
+    tables = _tables.setdefault(reporter, {})
+    if name not in tables:
+        tables[name] = TABLES[name](reporter)
+    return tables[name]
+
+def json_rows(data):
+    """ Rows of "data" as lists of JSON-ready values."""
+
+    data = data.copy()
+    for column in data.columns:
+        if pd.api.types.is_datetime64_any_dtype(data[column]):
+            data[column] = data[column].dt.strftime("%Y-%m-%d")
+    data = data.astype(object)
+    return data.where(data.notna(), None).values.tolist()
+
+def table_page(data, page=1, per_page=50, sort=None, order="asc",
+        search=None):
+    """ One page of "data" as a JSON-ready dict. "sort" is a column to
+    order by, "search" a substring the site id must contain. Unknown
+    columns are ignored."""
+
+    per_page = min(max(per_page, 1), MAX_PER_PAGE)
+    total = len(data)
+
+    if search and "site" in data.columns:
+        data = data[data["site"].str.contains(search, regex=False)]
+
+    if sort in data.columns:
+        data = data.sort_values(
+                sort, ascending=order != "desc", kind="stable",
+                na_position="last")
+    else:
+        sort = None
+
+    pages = max(math.ceil(len(data)/per_page), 1)
+    page = min(max(page, 1), pages)
+    start = (page - 1)*per_page
+
+    return {
+            "columns": list(data.columns),
+            "rows": json_rows(data.iloc[start:start + per_page]),
+            "total": total,
+            "filtered": len(data),
+            "page": page,
+            "pages": pages,
+            "per_page": per_page,
+            "sort": sort,
+            "order": order}
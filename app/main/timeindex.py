@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+
+class TimeIndex:
+    """ Timestamps of a frame sorted once, with the offsets of the first
+    test of every day and hour, so the tests of a day, an hour or any
+    date range are found with searchsorted instead of a full scan.
+
+    Rows of the frame are not moved: aggregations depend on their order.
+    "order" maps sorted positions to row positions and is None when the
+    frame is already sorted, the common case for exports."""
+
+    def __init__(self, times):
+        times = np.asarray(times, dtype="datetime64[ns]")
+        if (times[1:] >= times[:-1]).all():
+            self.order = None
+            self.times = times
+        else:
+            # Stable, so rows at the same time keep their order.
+            self.order = np.argsort(times, kind="stable")
+            self.times = times[self.order]
+
+        hours = self.times.astype("datetime64[h]")
+        self.hours, self.hour_starts = np.unique(hours, return_index=True)
+        days = self.hours.astype("datetime64[D]")
+        self.days, first = np.unique(days, return_index=True)
+        self.day_starts = self.hour_starts[first]
+
+    def __len__(self):
+        return len(self.times)
+
+    def positions(self, lo, hi):
+        """ Row positions of sorted positions lo to hi, in row order."""
+
+        if self.order is None:
+            return np.arange(lo, hi)
+        return np.sort(self.order[lo:hi])
+
+    def bounds(self, starts, keys, key):
+        """ Sorted positions of the run of "key" in an offsets table."""
+
+        i = np.searchsorted(keys, key)
+        if i == len(keys) or keys[i] != key:
+            return 0, 0
+        end = starts[i + 1] if i + 1 < len(starts) else len(self.times)
+        return starts[i], end
+
+    def day(self, date):
+        """ Row positions of the tests of "date"."""
+
+        day = np.datetime64(pd.Timestamp(date).date(), "D")
+        return self.positions(*self.bounds(self.day_starts, self.days, day))
+
+    def hour(self, timestamp):
+        """ Row positions of the tests of the hour "timestamp" falls in."""
+
+        hour = np.datetime64(pd.Timestamp(timestamp).floor("H"), "h")
+        return self.positions(
+                *self.bounds(self.hour_starts, self.hours, hour))
+
+    def between(self, start=None, end=None):
+        """ Row positions of the tests from "start", included, to "end",
+        excluded. Missing bounds are open."""
+
+        lo, hi = 0, len(self.times)
+        if start is not None:
+            lo = np.searchsorted(
+                    self.times, np.datetime64(pd.Timestamp(start), "ns"))
+        if end is not None:
+            hi = np.searchsorted(
+                    self.times, np.datetime64(pd.Timestamp(end), "ns"))
+        return self.positions(lo, max(lo, hi))
@@ -0,0 +1,115 @@
+import json
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request
+
+from app.main import bp
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds, in seconds, of the latency histogram buckets.
+BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+class Histogram:
+    """ Count of observed durations per bucket, Prometheus style."""
+
+    def __init__(self):
+        self.counts = [0]*(len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def to_dict(self):
+        """ Cumulative counts per bucket upper bound."""
+
+        buckets = {}
+        total = 0
+        for bound, count in zip(BUCKETS + ["+Inf"], self.counts):
+            total += count
+            buckets[str(bound)] = total
+        return {"count": self.count, "sum": self.sum, "buckets": buckets}
+
+class Metrics:
+    """ Latency histograms of the requests of this process, per endpoint
+    and per pipeline stage."""
+
+    def __init__(self):
+        self.requests = {}
+        self.stages = {}
+        self.lock = threading.Lock()
+
+    def observe(self, endpoint, seconds, stages):
+        with self.lock:
+            self.requests.setdefault(endpoint, Histogram()).observe(seconds)
+            for name, stage_seconds in stages.items():
+                self.stages.setdefault(name, Histogram()).observe(
+                        stage_seconds)
+
+    def to_dict(self):
+        with self.lock:
+            return {
+                    "requests": {
+                            endpoint: histogram.to_dict()
+                            for endpoint, histogram in self.requests.items()},
+                    "stages": {
+                            name: histogram.to_dict()
+                            for name, histogram in self.stages.items()}}
+
+metrics = Metrics()
+
+@contextmanager
+def stage(name):
+    """ Time a stage of the current request. Repeated stages add up.
+    Outside of requests, eg: in jobs, nothing is recorded."""
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if has_request_context():
+            stages = g.setdefault("stages", {})
+            stages[name] = stages.get(name, 0) + time.perf_counter() - start
+
+def server_timing(stages, total):
+    """ Server-Timing header value, durations in milliseconds."""
+
+    entries = [
+            "{};dur={:.1f}".format(name, seconds*1000)
+            for name, seconds in stages.items()]
+    entries.append("total;dur={:.1f}".format(total*1000))
+    return ", ".join(entries)
+
+@bp.before_app_request
+def start_timing():
+    g.request_start = time.perf_counter()
+
+@bp.after_app_request
+def record_timing(response):
+    start = g.get("request_start")
+    if start is None:
+        return response
+    total = time.perf_counter() - start
+    stages = g.get("stages", {})
+
+    response.headers["Server-Timing"] = server_timing(stages, total)
+    endpoint = request.endpoint or "unknown"
+    metrics.observe(endpoint, total, stages)
+
+    logger.info("request %s", json.dumps({
+            "method": request.method,
+            "path": request.path,
+            "endpoint": endpoint,
+            "status": response.status_code,
+            "total_ms": round(total*1000, 1),
+            "stages_ms": {
+                    name: round(seconds*1000, 1)
+                    for name, seconds in stages.items()}}))
+    return response
@@ -0,0 +1 @@
+""" Benchmarks of ingestion, the reporter and the compliance report."""
@@ -0,0 +1,213 @@
+""" Time ingestion, the reporter and the compliance report on synthetic
+gestionate exports, compare the times against the saved baselines and
+flag regressions. Run it from the repository root:
+
+    python -m benchmarks.run                      # 10k, 100k and 1M tests
+    python -m benchmarks.run --rows 10000 --save  # save new baselines
+
+The exit status is 1 if any benchmark regressed."""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+from app.main.reporter import Reporter, build_reporter_from_gestionate
+from app.main.reporter import clean_gestionate, normalize_schema
+from app.main.reporter import rollup_tests, check_compliance
+from app.main.reporter import filter_test_qty_tkt, get_compliance_report
+from app.main.ingest import read_gestionate_files, read_tickets
+from app.main.locations import locations
+from benchmarks.synthetic import write_workbooks, TYPES
+
+SIZES = [10000, 100000, 1000000]
+
+FOLDER = os.path.dirname(os.path.abspath(__file__))
+DATA_FOLDER = os.path.join(FOLDER, "data")
+BASELINES_PATH = os.path.join(FOLDER, "baselines.json")
+
+# Slowdown over the baseline flagged as a regression.
+THRESHOLD = 0.25
+
+# Differences shorter than this are noise, whatever their ratio.
+MIN_DELTA = 0.01
+
+# Filters applied by the apply_filters benchmark.
+FILTERS = {"profile_id": [12, 15], "type": ["scheduled", "monitoring"]}
+
+REPORTER_METHODS = [
+        "get_summary", "get_failed", "get_failed_by_day_hr",
+        "get_succeeded", "get_progress", "get_vsats"]
+
+def timed(run, setup=None, repeat=3):
+    """ Best wall time of "repeat" calls of run(setup()). "setup" is not
+    timed, and whatever is printed is discarded."""
+
+    best = None
+    for _ in range(repeat):
+        state = setup() if setup else None
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            run(state)
+            seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best
+
+def suite(rows, report_folder):
+    """ Name, setup and run functions of every benchmark, on "rows"
+    synthetic tests."""
+
+    paths, raw = write_workbooks(DATA_FOLDER, rows)
+    ids = locations.get()[0]
+    clean = clean_gestionate(raw)
+    normalized = normalize_schema(clean)
+    cube = rollup_tests(clean)
+    tickets = read_tickets(paths[2])
+
+    def filtered(rollup=None):
+        reporter = Reporter(normalized, rollup)
+        reporter.filter_sites(ids)
+        return reporter
+
+    def evaluated(rollup=None):
+        reporter = filtered(rollup)
+        reporter.eval_tests()
+        return reporter
+
+    # Tests of the compliance report, selected like compliance jobs do.
+    tests = Reporter(clean).filter_sites(ids)
+    tests = tests[(tests["res"] == "succeeded") & tests["type"].isin(TYPES)]
+    valid_tests, _ = filter_test_qty_tkt(tests, tickets, 30, 15)
+
+    raw_reporter = evaluated()
+    rollup_reporter = evaluated(cube)
+
+    benchmarks = [
+            ("ingest", None,
+                    lambda _: read_gestionate_files(paths[:2])),
+            ("build_reporter_from_gestionate", None,
+                    lambda _: build_reporter_from_gestionate(raw)),
+            ("rollup_tests", None, lambda _: rollup_tests(clean)),
+            ("Reporter.filter_sites", lambda: Reporter(normalized),
+                    lambda reporter: reporter.filter_sites(ids)),
+            ("Reporter.eval_tests", filtered,
+                    lambda reporter: reporter.eval_tests()),
+            ("Reporter.apply_filters", evaluated,
+                    lambda reporter: reporter.apply_filters(FILTERS))]
+    for method in REPORTER_METHODS:
+        benchmarks.append(("Reporter." + method, lambda: raw_reporter,
+                lambda reporter, method=method: getattr(reporter, method)()))
+    for method in ["get_summary", "get_failed_by_day_hr", "get_progress",
+            "get_vsats"]:
+        benchmarks.append(("Reporter." + method + "[rollup]",
+                lambda: rollup_reporter,
+                lambda reporter, method=method: getattr(reporter, method)()))
+    benchmarks += [
+            ("check_compliance", None,
+                    lambda _: check_compliance(valid_tests)),
+            ("filter_test_qty_tkt", None,
+                    lambda _: filter_test_qty_tkt(tests, tickets, 30, 15)),
+            ("get_compliance_report", None,
+                    lambda _: get_compliance_report(
+                            tests, tickets, report_folder))]
+    return benchmarks
+
+def load_baselines(path=BASELINES_PATH):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"results": {}}
+
+def save_baselines(baselines, results, path=BASELINES_PATH):
+    """ Merge "results" into the baselines and save them."""
+
+    for rows, times in results.items():
+        baselines["results"].setdefault(rows, {}).update(times)
+    baselines["environment"] = {
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "saved": time.strftime("%Y-%m-%d %H:%M:%S")}
+    with open(path + ".tmp", "w") as f:
+        json.dump(baselines, f, indent=2, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+def compare(seconds, baseline, threshold=THRESHOLD):
+    """ Change over the baseline, eg: "+12.5%", and whether it is a
+    regression."""
+
+    if baseline is None:
+        return "new", False
+    change = (seconds - baseline)/baseline if baseline else 0
+    regression = (
+            seconds > baseline*(1 + threshold)
+            and seconds - baseline > MIN_DELTA)
+    return "{:+.1%}".format(change), regression
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__,
+            formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--repeat", type=int, default=None,
+            help="runs per benchmark, the best one counts (default: 3, "
+            "1 above 100k tests)")
+    parser.add_argument("--only", nargs="+", default=None,
+            help="run only benchmarks with these names")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    parser.add_argument("--save", action="store_true",
+            help="save the times as the new baselines")
+    args = parser.parse_args(argv)
+
+    baselines = load_baselines()
+    results = {}
+    regressions = []
+
+    print("{:>8}  {:<40} {:>9} {:>9} {:>8}".format(
+            "rows", "benchmark", "seconds", "baseline", "change"))
+    with tempfile.TemporaryDirectory() as report_folder:
+        for rows in args.rows:
+            repeat = args.repeat or (3 if rows <= 100000 else 1)
+            saved = baselines["results"].get(str(rows), {})
+            times = results.setdefault(str(rows), {})
+
+            with contextlib.redirect_stdout(io.StringIO()):
+                benchmarks = suite(rows, report_folder)
+            for name, setup, run in benchmarks:
+                if args.only and name not in args.only:
+                    continue
+                seconds = timed(run, setup, repeat)
+                times[name] = seconds
+
+                baseline = saved.get(name)
+                change, regression = compare(
+                        seconds, baseline, args.threshold)
+                if regression:
+                    regressions.append((rows, name))
+                print("{:>8}  {:<40} {:>9.3f} {:>9} {:>8}{}".format(
+                        rows, name, seconds,
+                        "-" if baseline is None else
+                                "{:.3f}".format(baseline),
+                        change, "  REGRESSION" if regression else ""))
+                sys.stdout.flush()
+
+    if args.save:
+        save_baselines(baselines, results)
+        print("Baselines saved to {}.".format(BASELINES_PATH))
+
+    if regressions:
+        print("{} regressions over {:.0%}.".format(
+                len(regressions), args.threshold))
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,156 @@
+""" Synthetic gestionate exports, shaped like the real ones: a
+"ReportSheet" with a title row and the spanish headers of
+EXCEL_KEY_MAPPING, plus a tickets workbook for the same sites."""
+
+import hashlib
+import os
+
+import numpy as np
+import openpyxl
+import pandas as pd
+
+from app.main.locations import LOCATIONS_PATH
+from app.main.ingest import TICKET_COLUMNS
+
+# Download and upload speed of each profile, in Mbps.
+PROFILES = [(12, 3), (15, 3.75), (18, 4.5), (21, 5.25)]
+
+TYPES = ["scheduled", "monitoring", "on-demand"]
+
+# Errors of failed tests and how often they happen. Long messages are
+# truncated by the reporter.
+ERRORS = {
+        "Timeout": 0.5,
+        "Connection refused by remote host": 0.3,
+        "Test aborted: the remote terminal did not answer to the speed "
+        "test request in time": 0.2}
+
+# Order of the columns in the exports.
+HEADERS = [
+        "Ubicación", "BW Bajada Esperado", "BW Bajada Encontrado",
+        "BW Subida Esperado", "BW Subida Encontrado", "Resultado",
+        "Fecha de la Prueba", "Hora de la Prueba", "Perfil de Velocidad",
+        "Tipo de Prueba", "Error"]
+
+def profile_name(dn, up):
+    """ Profile label used by gestionate, eg: "Bajada:12-Subida:3"."""
+
+    return "Bajada:{:g}-Subida:{:g}".format(dn, up)
+
+def synthetic_sites(sites, unknown_sites=0.05, seed=0):
+    """ Site ids, most of them at known locations, eg: "39302-1". A
+    share "unknown_sites" is placed at locations missing from the
+    locations file, so site filtering has work to do."""
+
+    rng = np.random.default_rng(seed)
+    known = pd.read_pickle(LOCATIONS_PATH).to_numpy(dtype=np.int64)
+    unknown = np.arange(known.max() + 1, known.max() + 1 + sites)
+    locations = np.where(
+            rng.random(sites) < unknown_sites,
+            rng.choice(unknown, sites), rng.choice(known, sites))
+    ids = ["{}-{}".format(location, i % 3 + 1)
+            for i, location in enumerate(locations)]
+    return np.array(ids, dtype=object)
+
+def synthetic_tests(rows, sites=500, profiles=PROFILES, days=30,
+        failure_rate=0.1, below_rate=0.3, errors=ERRORS,
+        unknown_sites=0.05, start="2022-10-01", seed=0):
+    """ Raw tests with the headers of a gestionate export. Each site has
+    one profile. A share "failure_rate" of the tests fails with one of
+    "errors", and "below_rate" of the others finds less bit rate than
+    expected."""
+
+    rng = np.random.default_rng(seed)
+    site_ids = synthetic_sites(sites, unknown_sites, seed)
+    site_profile = rng.integers(0, len(profiles), sites)
+
+    site = rng.integers(0, sites, rows)
+    profile = site_profile[site]
+    exp_dn = np.array([dn for dn, _ in profiles], dtype=float)[profile]
+    exp_up = np.array([up for _, up in profiles], dtype=float)[profile]
+    names = np.array([profile_name(dn, up) for dn, up in profiles])
+
+    timestamp = pd.Timestamp(start) + pd.to_timedelta(
+            rng.integers(0, days*86400*1000, rows), unit="ms")
+
+    failed = rng.random(rows) < failure_rate
+    below = rng.random(rows) < below_rate
+    factor_dn = np.where(
+            below, rng.uniform(0.6, 1, rows), rng.uniform(1, 1.3, rows))
+    factor_up = np.where(
+            below, rng.uniform(0.6, 1, rows), rng.uniform(1, 1.3, rows))
+
+    messages = np.array(list(errors), dtype=object)
+    weights = np.array(list(errors.values()), dtype=float)
+    error = messages[rng.choice(
+            len(messages), rows, p=weights/weights.sum())]
+
+    return pd.DataFrame({
+            "Ubicación": site_ids[site],
+            "BW Bajada Esperado": exp_dn,
+            "BW Bajada Encontrado": np.where(
+                    failed, np.nan, np.round(exp_dn*factor_dn, 2)),
+            "BW Subida Esperado": exp_up,
+            "BW Subida Encontrado": np.where(
+                    failed, np.nan, np.round(exp_up*factor_up, 2)),
+            "Resultado": np.where(failed, "failed", "succeeded"),
+            "Fecha de la Prueba": timestamp.strftime(
+                    "%Y-%m-%d %H:%M:%S.%f"),
+            "Hora de la Prueba": timestamp.hour,
+            "Perfil de Velocidad": names[profile],
+            "Tipo de Prueba": np.array(TYPES)[rng.integers(0, 3, rows)],
+            "Error": np.where(failed, error, None)},
+            columns=HEADERS)
+
+def synthetic_tickets(tests, tickets=None, days=30, open_rate=0.1,
+        start="2022-10-01", seed=1):
+    """ Tickets of the locations in "tests", with the columns of a
+    tickets export. A share "open_rate" is not resolved yet."""
+
+    rng = np.random.default_rng(seed)
+    locations = tests["Ubicación"].str.split(
+            "-", n=1).str[0].astype(int).unique()
+    if tickets is None:
+        tickets = max(len(locations) // 4, 1)
+
+    opened = pd.Timestamp(start) + pd.to_timedelta(
+            rng.integers(0, days*86400, tickets), unit="s")
+    resolved = opened + pd.to_timedelta(
+            rng.integers(3600, 3*86400, tickets), unit="s")
+    resolved = resolved.where(rng.random(tickets) >= open_rate)
+
+    return pd.DataFrame(dict(zip(TICKET_COLUMNS, [
+            rng.choice(locations, tickets), opened, resolved])))
+
+def write_gestionate(tests, path, title="Reporte de Pruebas"):
+    """ Write tests as a gestionate export, streaming the rows."""
+
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet("ReportSheet")
+    sheet.append([title])
+    sheet.append(list(tests.columns))
+    for row in tests.itertuples(index=False, name=None):
+        sheet.append([None if value != value else value for value in row])
+    workbook.save(path)
+
+def write_workbooks(folder, rows, seed=0, **params):
+    """ Write operative and non operative exports with "rows" tests in
+    total and their tickets workbook to "folder". Workbooks written
+    before with the same arguments are reused. Return the paths of the
+    three workbooks and the generated tests."""
+
+    os.makedirs(folder, exist_ok=True)
+    tests = synthetic_tests(rows, seed=seed, **params)
+    digest = hashlib.sha1(repr(sorted(params.items())).encode()).hexdigest()
+    name = "{}_{}_{}".format(rows, seed, digest[:10])
+    paths = [
+            os.path.join(folder, "{}_{}.xlsx".format(kind, name))
+            for kind in ["op", "non_op", "tickets"]]
+
+    if not all(os.path.exists(path) for path in paths):
+        half = rows // 2
+        write_gestionate(tests.iloc[:half], paths[0])
+        write_gestionate(tests.iloc[half:], paths[1])
+        synthetic_tickets(tests, seed=seed + 1).to_excel(
+                paths[2], index=False)
+    return paths, tests
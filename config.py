@@ -9,4 +9,33 @@ class Config(object):
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
     GRAPH_FOLDER = os.path.join(basedir, "app", "static")
+    CHART_FOLDER = os.path.join(GRAPH_FOLDER, "chart_cache")
+    CHART_CACHE_BYTES = int(
+            os.environ.get('CHART_CACHE_BYTES') or 200 * 1024 * 1024)
     REPORT_FOLDER = os.path.join(basedir, "app", "reports")
+    JOB_FOLDER = os.path.join(REPORT_FOLDER, "jobs")
+
+    # Disk budget of the compliance reports kept for repeated runs.
+    REPORT_CACHE_BYTES = int(
+            os.environ.get('REPORT_CACHE_BYTES') or 500 * 1024 * 1024)
+
+    # Worker processes running compliance jobs.
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS') or 2)
+
+    # Worker processes rendering charts.
+    RENDER_WORKERS = int(os.environ.get('RENDER_WORKERS') or 3)
+
+    # Folder datasets are published to, shared read only by the workers.
+    # A tmpfs keeps them in memory once for all of them.
+    SHARED_FOLDER = os.environ.get('SHARED_FOLDER') or (
+            "/dev/shm/gestionate" if os.path.isdir("/dev/shm")
+            else os.path.join(basedir, "data_sets", "shared"))
+    SHARED_BYTES = int(
+            os.environ.get('SHARED_BYTES') or 1024 * 1024 * 1024)
+
+    # Level of the application logs, eg: DEBUG to see intermediate data.
+    LOG_LEVEL = os.environ.get('LOG_LEVEL') or 'INFO'
+
+    # Memory budget of the process-level cache of evaluated reporters.
+    REPORTER_CACHE_BYTES = int(
+            os.environ.get('REPORTER_CACHE_BYTES') or 512 * 1024 * 1024)
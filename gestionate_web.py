@@ -1,6 +1,66 @@
+import time
+
+import click
+
 from app import app, db
 from app.models import User
+from app.main.batch import find_periods, run_batch
 
 @app.shell_context_processor
 def make_shell_context():
     return {'db': db, 'User': User}
+
+@app.cli.command("compliance-batch")
+@click.argument("op_folder", type=click.Path(exists=True, file_okay=False))
+@click.argument(
+        "non_op_folder", type=click.Path(exists=True, file_okay=False))
+@click.argument(
+        "tickets_folder", type=click.Path(exists=True, file_okay=False))
+@click.option("--output", "-o", default="compliance_batch",
+        type=click.Path(file_okay=False), show_default=True,
+        help="Folder the reports are written to.")
+@click.option("--remove-vsats", default="",
+        help="Comma separated VSAT ids to leave out, or a file with them.")
+@click.option("--type", "types", multiple=True, show_default=True,
+        type=click.Choice(["scheduled", "on-demand", "monitoring"]),
+        default=["scheduled", "on-demand", "monitoring"],
+        help="Test types to count, repeat for several.")
+@click.option("--workers", type=int, default=None,
+        help="Worker processes, JOB_WORKERS by default.")
+def compliance_batch(op_folder, non_op_folder, tickets_folder, output,
+        remove_vsats, types, workers):
+    """ Compliance reports of many periods at once. Workbooks of the same
+    period share their file name in OP_FOLDER, NON_OP_FOLDER and
+    TICKETS_FOLDER, eg: 2022-10.xlsx. One report per period and their
+    combined payment summary are written to the output folder."""
+
+    periods, incomplete = find_periods(
+            op_folder, non_op_folder, tickets_folder)
+    for period in incomplete:
+        click.echo(
+                "Skipping {}: workbooks missing.".format(period), err=True)
+    if not periods:
+        raise click.ClickException("No complete periods found.")
+
+    try:
+        with open(remove_vsats) as f:
+            remove_vsats = f.read()
+    except OSError:
+        pass
+    remove_ids = [
+            item.strip()
+            for item in remove_vsats.replace("\n", ",").split(",")
+            if item.strip()]
+
+    click.echo("{} periods, {} VSATs removed, types: {}.".format(
+            len(periods), len(remove_ids), ", ".join(types)))
+    start = time.perf_counter()
+
+    def done(period, path, seconds):
+        click.echo("{:<20} {:>8.1f}s  {}".format(period, seconds, path))
+
+    summary = run_batch(
+            periods, remove_ids, list(types), app.config["REPORT_FOLDER"],
+            output, workers or app.config["JOB_WORKERS"], done)
+    click.echo("Payment summary written to {} in {:.1f}s.".format(
+            summary, time.perf_counter() - start))
@@ -0,0 +1,148 @@
+""" The profile x hour compliance table against the per hour loop it
+replaced, kept here as reference. The table is what the compliance
+report bills by, so it must match it cell for cell."""
+
+import numpy as np
+import pandas as pd
+
+from app.main.reporter import compliance_table, check_compliance
+
+def reference_eval(row, direction):
+    expected = getattr(row, "exp_" + direction + "_br")
+    found = getattr(row, direction + "_br")
+    if expected > found:
+        return False
+    return True
+
+def reference_check_compliance(data):
+    profile_compliance = pd.DataFrame()
+
+    # Save expected performance.
+    exp_dn_br = data["exp_dn_br"].unique()[0]
+    exp_up_br = data["exp_up_br"].unique()[0]
+
+    for hour in range(6,21):
+
+        hour_data = data[data["timestamp"].dt.hour == hour].copy()
+        if hour_data.empty:
+            continue
+
+        # This is the 5 % of X for the tests in a given hour.
+        dn_nth_value = hour_data["dn_br"].quantile(
+                0.05, interpolation="nearest")
+        up_nth_value = hour_data["up_br"].quantile(
+                0.05, interpolation="nearest")
+
+        # Evaluate if 5 % of X is above expected bit rate.
+        dn_pass = True if dn_nth_value >= exp_dn_br else False
+        up_pass = True if up_nth_value >= exp_up_br else False
+
+        # Check if tests pass.
+        hour_data["dn_pass"] = hour_data.apply(
+                lambda row: reference_eval(row, "dn"), axis=1)
+        hour_data["up_pass"] = hour_data.apply(
+                lambda row: reference_eval(row, "up"), axis=1)
+
+        # Count passed and failed tests.
+        dn_pass_count = len(hour_data[hour_data["dn_pass"] == True])
+        up_pass_count = len(hour_data[hour_data["up_pass"] == True])
+
+        count = len(hour_data)
+
+        hour_compliance = pd.DataFrame({
+                "hour": hour,
+                "count": count,
+                "exp_dn_br": exp_dn_br,
+                "exp_up_br": exp_up_br,
+                "dn_nth_value": dn_nth_value,
+                "up_nth_value": up_nth_value,
+                "avg_dn_br": np.average(hour_data["dn_br"]),
+                "avg_up_br": np.average(hour_data["up_br"]),
+                "dn_pass": dn_pass,
+                "up_pass": up_pass,
+                "pass": dn_pass & up_pass,
+                "dn_pass_count": dn_pass_count,
+                "up_pass_count": up_pass_count,
+                "dn_pass_%": dn_pass_count*100/count,
+                "up_pass_%": up_pass_count*100/count} ,index=[0])
+
+        # Append hour data to profile data.
+        profile_compliance = pd.concat(
+                [profile_compliance, hour_compliance],
+                ignore_index = True, axis=0)
+
+    return profile_compliance
+
+PROFILES = {
+        "Bajada:12-Subida:3": (12.0, 3.0),
+        "Bajada:15-Subida:3.75": (15.0, 3.75),
+        "Bajada:18-Subida:4.5": (18.0, 4.5),
+        "Bajada:21-Subida:5.25": (21.0, 5.25)}
+
+def make_tests(rows=5000, seed=0):
+    """ Valid tests of several profiles, out of time order, with NaN bit
+    rates, found bit rates equal to the expected ones and a profile
+    whose 7 am tests all lack bit rates."""
+
+    rng = np.random.default_rng(seed)
+    names = np.array(list(PROFILES))
+    exp_dn = np.array([exp[0] for exp in PROFILES.values()])
+    exp_up = np.array([exp[1] for exp in PROFILES.values()])
+    profile = rng.integers(0, len(names), rows)
+
+    timestamp = pd.Timestamp("2022-10-01") + pd.to_timedelta(
+            rng.integers(0, 3*24*60, rows), unit="min")
+    factor = rng.choice([0.5, 0.9, 1, 1.1, 1.3], (2, rows))
+    dn_br = exp_dn[profile]*factor[0]*rng.choice([1, 1.01], rows)
+    up_br = exp_up[profile]*factor[1]
+    dn_br[rng.random(rows) < 0.05] = np.nan
+    up_br[rng.random(rows) < 0.05] = np.nan
+    empty_hour = (profile == 3) & (timestamp.hour == 7)
+    dn_br[empty_hour] = np.nan
+    up_br[empty_hour] = np.nan
+
+    return pd.DataFrame({
+            "site": ["39302-1"]*rows,
+            "exp_dn_br": exp_dn[profile],
+            "dn_br": dn_br,
+            "exp_up_br": exp_up[profile],
+            "up_br": up_br,
+            "res": "succeeded",
+            "timestamp": timestamp,
+            "hour": rng.integers(0, 24, rows),
+            "profile": names[profile],
+            "type": "scheduled"})
+
+def test_fixture_covers_edge_cases():
+    data = make_tests()
+
+    assert data["dn_br"].isna().any()
+    assert data["up_br"].isna().any()
+    assert (data["exp_dn_br"] == data["dn_br"]).any()
+    assert (data["exp_up_br"] == data["up_br"]).any()
+    assert not data["timestamp"].is_monotonic_increasing
+
+def test_check_compliance():
+    data = make_tests()
+    for profile in PROFILES:
+        profile_data = data[data["profile"] == profile]
+
+        pd.testing.assert_frame_equal(
+                check_compliance(profile_data),
+                reference_check_compliance(profile_data))
+
+def test_compliance_table_of_every_profile():
+    data = make_tests()
+    table = compliance_table(data)
+    assert set(table["profile"]) == set(PROFILES)
+
+    # As the report splits it in one sheet per profile.
+    for profile in PROFILES:
+        compliance_data = table[table["profile"] == profile]
+        compliance_data = compliance_data.drop(
+                columns=["profile"]).reset_index(drop=True)
+
+        pd.testing.assert_frame_equal(
+                compliance_data,
+                reference_check_compliance(
+                        data[data["profile"] == profile]))
@@ -0,0 +1,29 @@
+import os
+
+from app.main.diskcache import evict_lru
+
+def write(path, size, mtime):
+    with open(path, "wb") as f:
+        f.write(b"x"*size)
+    os.utime(path, (mtime, mtime))
+
+def test_least_recently_used_are_removed(tmp_path):
+    for i, name in enumerate(["a.png", "b.png", "c.png"]):
+        write(tmp_path / name, 100, 1000 + i)
+    write(tmp_path / "d.tmp", 1000, 0)
+
+    evict_lru(tmp_path, 250, lambda entry: entry.name.endswith(".png"))
+
+    assert sorted(os.listdir(tmp_path)) == ["b.png", "c.png", "d.tmp"]
+
+def test_folders_and_kept_entry(tmp_path):
+    for i, name in enumerate(["a", "b", "c"]):
+        os.makedirs(tmp_path / name)
+        write(tmp_path / name / "report.xlsx", 100, 0)
+        os.utime(tmp_path / name, (1000 + i, 1000 + i))
+
+    evict_lru(
+            tmp_path, 200, lambda entry: entry.is_dir(),
+            keep=str(tmp_path / "a"))
+
+    assert sorted(os.listdir(tmp_path)) == ["a", "c"]
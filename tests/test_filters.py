@@ -0,0 +1,14 @@
+from app import app
+
+def test_sites_one_per_line(monkeypatch):
+    monkeypatch.setitem(app.config, "LOGIN_DISABLED", True)
+    monkeypatch.setitem(app.config, "WTF_CSRF_ENABLED", False)
+    client = app.test_client()
+
+    res = client.post("/filters", data={
+            "sites": "39302-1\r\n39303-2, 39304-1\n\n39305-1,39306-2"})
+
+    assert res.status_code == 302
+    with client.session_transaction() as session:
+        assert session["filters"] == {"site": [
+                "39302-1", "39303-2", "39304-1", "39305-1", "39306-2"]}
@@ -0,0 +1,63 @@
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app import app
+from app.main.grapher import render_charts, wait_chart, render_pool
+
+def make_scatter(rows):
+    timestamp = pd.Timestamp("2022-10-01") + pd.to_timedelta(
+            np.arange(rows), unit="min")
+    return pd.DataFrame({
+            "x": timestamp,
+            "y": np.arange(rows) % 7 + 1.0,
+            "pass": np.arange(rows) % 3 > 0})
+
+@pytest.fixture
+def chart_folder(tmp_path, monkeypatch):
+    folder = tmp_path / "chart_cache"
+    monkeypatch.setitem(app.config, "CHART_FOLDER", str(folder))
+    return folder
+
+def test_concurrent_renders_of_the_same_chart(chart_folder):
+    data = make_scatter(200)
+    names = []
+    errors = []
+
+    def render():
+        with app.app_context():
+            try:
+                names.extend(render_charts([
+                        ("progress_scatter", data, {"dot_size": 1}),
+                        ("progress_scatter", data, {"dot_size": 1})]))
+            except Exception as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=render) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert len(set(names)) == 1
+    with app.app_context():
+        assert wait_chart(names[0]) is not None
+    assert os.listdir(chart_folder) == [names[0]]
+
+def test_render_after_a_worker_died(chart_folder):
+    with app.app_context():
+        executor = render_pool.get(app.config["RENDER_WORKERS"])
+        with pytest.raises(Exception):
+            executor.submit(os._exit, 1).result()
+
+        name, = render_charts([("progress_scatter", make_scatter(50), {})])
+        assert wait_chart(name) == str(chart_folder / name)
+
+def test_wait_for_an_unknown_chart(chart_folder):
+    with app.app_context():
+        assert wait_chart("0"*40 + ".png", timeout=0) is None
+        assert wait_chart("../secret.png") is None
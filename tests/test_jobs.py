@@ -0,0 +1,88 @@
+import os
+import time
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from app.main.jobs import submit_compliance_job, read_job, write_job
+from app.main.jobs import job_finished, job_pool
+
+def wait_job(job_folder, job_id, timeout=30):
+    deadline = time.monotonic() + timeout
+    job = read_job(job_folder, job_id)
+    while job["status"] in ["queued", "running"]:
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+        job = read_job(job_folder, job_id)
+    return job
+
+def submit(job_folder, report_folder):
+    missing = str(report_folder / "missing.xlsx")
+    return submit_compliance_job(
+            str(job_folder), 1, op_path=missing, non_op_path=missing,
+            tickets_path=missing, remove_ids=[], types=["scheduled"],
+            report_folder=str(report_folder))
+
+def test_submit_after_a_worker_died(tmp_path):
+    with pytest.raises(Exception):
+        job_pool.get(1).submit(os._exit, 1).result()
+
+    job_id = submit(tmp_path / "jobs", tmp_path)
+
+    # The job ran, its inputs are missing.
+    job = wait_job(str(tmp_path / "jobs"), job_id)
+    assert job["status"] == "failed"
+    assert "missing.xlsx" in job["error"]
+
+def test_submit_refused(tmp_path, monkeypatch):
+    def refuse(*args):
+        raise RuntimeError("pool shut down")
+    monkeypatch.setattr(job_pool, "submit", refuse)
+
+    job_id = submit(tmp_path / "jobs", tmp_path)
+
+    job = read_job(str(tmp_path / "jobs"), job_id)
+    assert job["status"] == "failed"
+    assert job["error"] == "pool shut down"
+
+def test_worker_died_while_running(tmp_path):
+    job_folder = str(tmp_path)
+    job = {"id": "a"*32, "status": "running", "error": None}
+    write_job(job_folder, job)
+    future = Future()
+    future.set_exception(BrokenProcessPool("worker died"))
+
+    job_finished(job_folder, job["id"], future)
+
+    job = read_job(job_folder, job["id"])
+    assert job["status"] == "failed"
+    assert job["error"] == "worker died"
+
+def test_finished_jobs_are_kept(tmp_path):
+    job_folder = str(tmp_path)
+    job = {"id": "b"*32, "status": "done", "error": None}
+    write_job(job_folder, job)
+    future = Future()
+    future.set_result(None)
+
+    job_finished(job_folder, job["id"], future)
+
+    assert read_job(job_folder, job["id"])["status"] == "done"
+
+def test_download_of_an_evicted_report(tmp_path, monkeypatch):
+    from app import app
+
+    monkeypatch.setitem(app.config, "LOGIN_DISABLED", True)
+    monkeypatch.setitem(app.config, "JOB_FOLDER", str(tmp_path / "jobs"))
+    monkeypatch.setitem(app.config, "REPORT_FOLDER", str(tmp_path))
+    os.makedirs(tmp_path / "jobs")
+    job = {
+            "id": "c"*32, "status": "done", "error": None,
+            "file": os.path.join("cache", "d"*40, "Compliance.xlsx")}
+    write_job(str(tmp_path / "jobs"), job)
+
+    res = app.test_client().get("/compliance/{}/download".format(job["id"]))
+
+    assert res.status_code == 302
+    assert res.headers["Location"].endswith("/compliance")
@@ -0,0 +1,116 @@
+""" The vectorized transforms of the reporter against the row-wise
+versions they replaced, kept here as references."""
+
+import numpy as np
+import pandas as pd
+
+from app.main.reporter import site_location, short_error, eval_direction
+from app.main.reporter import parse_gestionate
+
+def reference_site_location(row):
+    return int(row.site.split("-")[0])
+
+def reference_profile_id(row):
+    profile = row["profile"]
+    return int(profile.split("-")[0].split(":")[1].split(".")[0].strip())
+
+def reference_short_error(row):
+    # Tests without error were never truncated, they stay missing.
+    if not isinstance(row.error, str):
+        return row.error
+    return (row.error[:40] + '..') if len(row.error) > 75 else row.error
+
+def reference_eval(row, direction):
+    expected = getattr(row, "exp_" + direction + "_br")
+    found = getattr(row, direction + "_br")
+    if expected > found:
+        return False
+    return True
+
+LONG_ERROR = (
+        "Test aborted: the remote terminal did not answer to the speed "
+        "test request in time")
+
+def make_tests(rows=500, seed=0):
+    """ Renamed gestionate tests with NaN errors, errors longer than 75
+    characters and found bit rates equal to the expected ones."""
+
+    rng = np.random.default_rng(seed)
+    profiles = np.array([
+            "Bajada:12-Subida:3", "Bajada:15.0-Subida:3.75",
+            "Bajada: 18 -Subida:4.5", "Bajada:21-Subida:5.25"])
+    exp_dn = np.array([12, 15, 18, 21], dtype=float)
+    exp_up = np.array([3, 3.75, 4.5, 5.25])
+    profile = rng.integers(0, len(profiles), rows)
+
+    factor = rng.choice([0.8, 1, 1.2], (2, rows))
+    dn_br = exp_dn[profile]*factor[0]
+    up_br = exp_up[profile]*factor[1]
+    failed = rng.random(rows) < 0.2
+    dn_br[failed] = np.nan
+    up_br[failed] = np.nan
+
+    errors = np.array(["Timeout", LONG_ERROR, "x"*75, "y"*76], dtype=object)
+    error = np.where(failed, errors[rng.integers(0, 4, rows)], None)
+
+    timestamp = pd.Timestamp("2022-10-01") + pd.to_timedelta(
+            np.arange(rows), unit="min")
+    return pd.DataFrame({
+            "site": ["{}-{}".format(location, i % 3 + 1)
+                    for i, location in enumerate(
+                            rng.integers(10000, 99999, rows))],
+            "exp_dn_br": exp_dn[profile],
+            "dn_br": dn_br,
+            "exp_up_br": exp_up[profile],
+            "up_br": up_br,
+            "res": np.where(failed, "failed", "succeeded"),
+            "timestamp": timestamp.strftime("%Y-%m-%d %H:%M:%S.%f"),
+            "hour": timestamp.hour,
+            "profile": profiles[profile],
+            "type": "scheduled",
+            "error": error})
+
+def test_fixture_covers_edge_cases():
+    data = make_tests()
+
+    assert data["error"].isna().any()
+    assert (data["error"].str.len() > 75).any()
+    assert (data["error"].str.len() == 75).any()
+    assert (data["exp_dn_br"] == data["dn_br"]).any()
+    assert (data["exp_up_br"] == data["up_br"]).any()
+
+def test_site_location():
+    data = make_tests()
+    expected = data.apply(reference_site_location, axis=1)
+
+    assert (site_location(data["site"]) == expected).all()
+
+def test_profile_id():
+    data = make_tests()
+    expected = data.apply(reference_profile_id, axis=1)
+    parsed = parse_gestionate(data.copy())
+
+    assert (parsed["profile_id"] == expected).all()
+
+def test_short_error():
+    data = make_tests()
+    expected = data.apply(reference_short_error, axis=1)
+
+    pd.testing.assert_series_equal(
+            short_error(data["error"]), expected, check_names=False)
+
+def test_short_error_categorical():
+    data = make_tests()
+    expected = data.apply(reference_short_error, axis=1)
+    errors = data["error"].astype("category")
+
+    pd.testing.assert_series_equal(
+            short_error(errors), expected, check_names=False)
+
+def test_eval_direction():
+    data = make_tests()
+    for direction in ["dn", "up"]:
+        expected = data.apply(
+                lambda row: reference_eval(row, direction), axis=1)
+
+        assert (eval_direction(data, direction) == expected).all()
@@ -0,0 +1,81 @@
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from app.main.store import save_dataset, append_dataset, load_dataset
+from app.main.store import dataset_parts, part_keys_path
+from app.main.store import load_rollup, part_rollup_path
+
+def make_clean(rows, start=0):
+    """ Cleaned tests, one per minute from "start"."""
+
+    minutes = np.arange(start, start + rows)
+    timestamp = pd.Timestamp("2022-10-01") + pd.to_timedelta(
+            minutes, unit="min")
+    return pd.DataFrame({
+            "site": ["39302-1"]*rows,
+            "exp_dn_br": 12.0,
+            "dn_br": 10.0 + minutes % 5,
+            "exp_up_br": 3.0,
+            "up_br": 2.0 + minutes % 3,
+            "res": "succeeded",
+            "timestamp": timestamp,
+            "hour": timestamp.hour,
+            "profile": "Bajada:12-Subida:3",
+            "type": "scheduled",
+            "error": None,
+            "profile_id": 12})
+
+def test_append_skips_known_tests(tmp_path):
+    path = str(tmp_path / "dataset")
+    save_dataset(make_clean(100), path)
+    summary = append_dataset(make_clean(100, start=50), path)
+
+    assert summary == {"added": 50, "duplicates": 50}
+    assert len(load_dataset(path)) == 150
+
+def test_append_leaves_no_temporary_files(tmp_path):
+    path = str(tmp_path / "dataset")
+    save_dataset(make_clean(10), path)
+    append_dataset(make_clean(10, start=10), path)
+
+    assert not [name for name in os.listdir(path) if name.endswith(".tmp")]
+    assert len(dataset_parts(path)) == 2
+
+def test_missing_keys_are_rebuilt(tmp_path):
+    path = str(tmp_path / "dataset")
+    save_dataset(make_clean(100), path)
+    keys_path = part_keys_path(dataset_parts(path)[0])
+    keys = np.load(keys_path)
+    os.remove(keys_path)
+
+    summary = append_dataset(make_clean(100), path)
+
+    assert summary == {"added": 0, "duplicates": 100}
+    assert (np.load(keys_path) == keys).all()
+
+def test_concurrent_rollup_rebuilds(tmp_path):
+    path = str(tmp_path / "dataset")
+    save_dataset(make_clean(5000), path)
+    rollup_path = part_rollup_path(dataset_parts(path)[0])
+    expected = load_rollup(path)
+    os.remove(rollup_path)
+    errors = []
+
+    def rebuild():
+        try:
+            load_rollup(path)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=rebuild) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert not [name for name in os.listdir(path) if name.endswith(".tmp")]
+    assert load_rollup(path).equals(expected)
@@ -0,0 +1,63 @@
+import pandas as pd
+
+from app.main.ingest import TICKET_COLUMNS
+from app.main.reporter import filter_test_qty_tkt, ticket_downtime
+
+def make_tests(sites):
+    """ Succeeded tests, "count" of them for each site id."""
+
+    rows = []
+    for site, count in sites.items():
+        for i in range(count):
+            rows.append({
+                    "site": site,
+                    "profile": "Bajada:12-Subida:3",
+                    "timestamp": pd.Timestamp("2022-10-01") + pd.Timedelta(
+                            hours=i)})
+    return pd.DataFrame(rows)
+
+def make_tickets(rows):
+    return pd.DataFrame(rows, columns=TICKET_COLUMNS)
+
+def test_empty_tickets_export():
+    tests = make_tests({"39302-1": 30, "27075-2": 20})
+    valid, summary = filter_test_qty_tkt(tests, make_tickets([]), 30, 15)
+
+    validity = summary.set_index("site")["validity"]
+    assert list(summary["dn_time_days"]) == [0, 0]
+    assert validity[39302] == "valid"
+    assert validity[27075] == "< 30 tests"
+    assert set(valid["site"]) == {"39302-1"}
+
+def test_tickets_outside_window():
+    tests = make_tests({"39302-1": 20})
+    tickets = make_tickets([
+            [39302, "2022-09-01 00:00", "2022-09-05 00:00"]])
+    window = (pd.Timestamp("2022-10-01"), pd.Timestamp("2022-11-01"))
+    valid, summary = filter_test_qty_tkt(tests, tickets, 30, 15, window)
+
+    assert list(summary["dn_time_days"]) == [0]
+    assert valid.empty
+
+def test_ticket_downtime_without_positive_tickets():
+    tickets = pd.DataFrame({
+            "site": [39302],
+            "start": pd.to_datetime(["2022-10-02"]),
+            "end": pd.to_datetime(["2022-10-01"])})
+    downtime = ticket_downtime(tickets)
+
+    assert list(downtime.columns) == ["site", "dn_time", "dn_time_days"]
+    assert downtime.empty
+    assert downtime["dn_time"].dtype == "timedelta64[ns]"
+
+def test_ticket_downtime_merges_overlaps():
+    tickets = pd.DataFrame({
+            "site": [39302, 39302, 27075],
+            "start": pd.to_datetime(
+                    ["2022-10-01", "2022-10-02", "2022-10-01"]),
+            "end": pd.to_datetime(
+                    ["2022-10-03", "2022-10-04", "2022-10-01 12:00"])})
+    downtime = ticket_downtime(tickets).set_index("site")
+
+    assert downtime.loc[39302, "dn_time_days"] == 3
+    assert downtime.loc[27075, "dn_time_days"] == 0